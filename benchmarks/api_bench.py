@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#####################################################################################################
+#
+# Copyright:
+#   - 2023 T.Fischer <mail |at| sedi -DOT- one>
+#
+# License: GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+#
+#####################################################################################################
+"""
+End-to-end benchmark of the inventory and the device update against a local Open-AudIT stand-in.
+
+Starts benchmarks/fake_openaudit.py with synthetic data in a separate process, then
+    - inventory: builds the inventory through ansible's InventoryManager (i.e. InventoryModule.parse)
+    - update: runs OA_device.update for --updates devices (changing one custom field each)
+and reports wall time, the requests the server has seen and the peak memory (max RSS) of this process.
+
+Requires ansible-core and requests. The collection must be importable as ansible_collections.sedi.openaudit,
+i.e. either installed or checked out as <path>/ansible_collections/sedi/openaudit.
+
+usage: python3 benchmarks/api_bench.py [--devices 10000] [--latency 0.02] [--mode inventory,update] [--json]
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from urllib.request import urlopen
+
+import fake_openaudit
+
+# allow running from a checkout located at <path>/ansible_collections/sedi/openaudit
+_collections_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+if os.path.basename(_collections_dir) == 'ansible_collections':
+    sys.path.insert(0, os.path.dirname(_collections_dir))
+    # ansible's collection loader needs to find it as well (read on first import of ansible)
+    os.environ.setdefault('ANSIBLE_COLLECTIONS_PATH', os.path.dirname(_collections_dir))
+
+os.environ.setdefault('ANSIBLE_INVENTORY_ENABLED', 'sedi.openaudit.inventory')
+
+INVENTORY = '''
+plugin: sedi.openaudit.inventory
+oa_api_server: {server}
+oa_api_proto: http
+oa_username: bench
+oa_password: bench
+oa_max_concurrency: {concurrency}
+oa_page_size: {page_size}
+oa_fieldsTranslate:
+{fields}
+{extra}keyed_groups:
+  # dc is set by the location suites of the fake server (i.e. every host has one)
+  - key: dc
+    prefix: {keyed_prefix}
+'''
+
+KEYED_PREFIX = 'dc'
+
+
+def serve(args, queue):
+    server = fake_openaudit.from_arguments(args).server()
+    queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def server_stats(base_url, reset=False):
+    if reset:
+        return json.loads(urlopen(base_url + '/_reset', data=b'').read())
+    return json.loads(urlopen(base_url + '/_stats').read())
+
+
+def max_rss_mb():
+    # kilobytes on linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024.0) if sys.platform == 'darwin' else rss / 1024.0
+
+
+def bench_inventory(args, server):
+    from ansible.inventory.manager import InventoryManager
+    from ansible.parsing.dataloader import DataLoader
+
+    fields = '\n'.join('  field%d: %d' % (fid, fid) for fid in range(1, args.mapped_fields + 1))
+    extra = 'oa_validators_path: %s\n' % args.validators_path if args.validators_path else ''
+    extra += 'oa_session_path: %s\n' % args.session_path if args.session_path else ''
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'bench.openaudit.yml')
+        with open(path, 'w') as f:
+            f.write(INVENTORY.format(server=server, concurrency=args.concurrency, page_size=args.page_size,
+                                     fields=fields or '  {}', extra=extra, keyed_prefix=KEYED_PREFIX))
+        start = time.perf_counter()
+        inventory = InventoryManager(loader=DataLoader(), sources=[path])
+        elapsed = time.perf_counter() - start
+
+    # an undefined key does not fail (keyed_groups are not strict), it just creates no groups
+    keyed = len([g for g in inventory.groups if g.startswith(KEYED_PREFIX + '_')])
+    if inventory.hosts and not keyed:
+        raise RuntimeError("no keyed groups (%s_*) have been created, the benchmark does not cover them" % KEYED_PREFIX)
+
+    return {'seconds': elapsed, 'hosts': len(inventory.hosts), 'groups': len(inventory.groups), 'keyed_groups': keyed}
+
+
+def bench_update(args, server):
+    from ansible_collections.sedi.openaudit.plugins.module_utils.common import OA_vars as oavars
+    from ansible_collections.sedi.openaudit.plugins.module_utils.common import OA_get as oaget
+    from ansible_collections.sedi.openaudit.plugins.module_utils.common import OA_client as oaclient
+    from ansible_collections.sedi.openaudit.plugins.module_utils.device import OA_device as oadev
+
+    from ansible.utils.display import Display
+
+    class Runner():
+        # stands in for the set action plugin (which passes itself as self)
+        oa_client = oaclient(validate_certs=False, pool_size=args.concurrency, retries=0)
+        _display = Display()
+
+    runner = Runner()
+    scheme_server = 'http://' + server
+    dictFieldMap = {'field1': 1}
+
+    start = time.perf_counter()
+    cookie = oaget.logon_api(runner, uri=scheme_server + oavars.logon_uri_path, usr='bench', pw='bench',
+                             task_vars={}, tmp=None, parsed_args={})
+    changed = 0
+    for sid in range(1, min(args.updates, args.devices) + 1):
+        module_args = {
+            'method': 'GET',
+            'headers': {'Cookie': cookie},
+            'body_format': 'form-urlencoded',
+            'url': scheme_server + oavars.device_uri_path + '?format=json&properties=system.id,system.fqdn',
+        }
+        ret = oadev.update(runner, scheme_server=scheme_server, task_vars={'dictFieldMap': dictFieldMap},
+                           module_args=module_args, tmp=None,
+                           device_data={'fqdn': 'host%d.example.local' % sid, 'fields': {'field1': 'bench %f' % start}})
+        changed += 1 if ret.get('changed') else 0
+    elapsed = time.perf_counter() - start
+
+    return {'seconds': elapsed, 'devices': min(args.updates, args.devices), 'changed': changed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    fake_openaudit.add_arguments(parser)
+    parser.add_argument('--mode', default='inventory,update',
+                        help='comma separated list of benchmarks to run (default: %(default)s)')
+    parser.add_argument('--mapped-fields', type=int, default=6,
+                        help='custom fields mapped in oa_fieldsTranslate (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=8, help='oa_max_concurrency (default: %(default)s)')
+    parser.add_argument('--page-size', type=int, default=1000, help='oa_page_size (default: %(default)s)')
+    parser.add_argument('--updates', type=int, default=100, help='devices to update (default: %(default)s)')
+    parser.add_argument('--validators-path',
+                        help='oa_validators_path, run twice (with --etags) to see the conditional requests')
+    parser.add_argument('--session-path',
+                        help='oa_session_path, the login gets re-used by following runs (see --session-ttl of the server)')
+    parser.add_argument('--json', action='store_true', help='print the results as json')
+    args = parser.parse_args()
+
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=serve, args=(args, queue))
+    proc.daemon = True
+    proc.start()
+    server = '127.0.0.1:%d' % queue.get(timeout=600)
+    base_url = 'http://' + server
+
+    results = {}
+    try:
+        for mode in [m.strip() for m in args.mode.split(',') if m.strip()]:
+            bench = {'inventory': bench_inventory, 'update': bench_update}[mode]
+            server_stats(base_url, reset=True)
+            results[mode] = bench(args, server)
+            stats = server_stats(base_url)
+            results[mode].update({
+                'requests': stats['requests'],
+                'bytes_sent_by_server': stats['bytes_sent'],
+                'endpoints': stats['endpoints'],
+                'max_rss_mb': round(max_rss_mb(), 1),
+            })
+    finally:
+        proc.terminate()
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return
+
+    print('%d devices, %.3fs latency' % (args.devices, args.latency))
+    for mode, res in results.items():
+        print('%-10s %8.3fs %8d requests %12d bytes %8.1f MB max rss' % (
+            mode, res['seconds'], res['requests'], res['bytes_sent_by_server'], res['max_rss_mb']))
+
+
+if __name__ == '__main__':
+    main()
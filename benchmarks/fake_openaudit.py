@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#####################################################################################################
+#
+# Copyright:
+#   - 2023 T.Fischer <mail |at| sedi -DOT- one>
+#
+# License: GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+#
+#####################################################################################################
+"""
+Local stand-in for the Open-AudIT API serving synthetic data.
+
+Serves the parts of the API used by this collection (below /open-audit/index.php):
+    POST  /logon
+    GET   /devices                  (incl. sub_resource=field, limit/offset and filters)
+    GET   /devices/<id>             (incl. include=field, listing all custom fields)
+    PATCH /devices/<id>
+    GET   /fields
+    GET   /locations
+    GET   /groups
+    GET   /groups/<id>/execute
+and for the benchmark harness:
+    GET   /_stats                   (requests and bytes per endpoint, not counted itself)
+    POST  /_reset                   (reset the stats)
+
+Filters use the syntax of the API: <property>=<value>, where value can be
+in(a,b,..), !=x, >x, <x or like%x% (matched case insensitive).
+
+With --etags the collections (fields, locations, groups) get an ETag and
+a matching If-None-Match is answered with 304 Not Modified.
+
+usage: python3 benchmarks/fake_openaudit.py [--port 8080] [--devices 10000] [--latency 0.02] ...
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+
+try:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+except ImportError:
+    # python < 3.7
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+    class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+from urllib.parse import parse_qsl, unquote_plus, urlsplit
+
+API_PREFIX = '/open-audit/index.php'
+# query parameters which are not filters
+RESERVED_PARAMS = ('format', 'properties', 'limit', 'offset', 'sub_resource', 'include', 'sort')
+
+
+class Dataset():
+    """
+    synthetic Open-AudIT data, the same for the same arguments
+    """
+
+    def __init__(self, devices=10000, locations=None, orgs=10, groups=50, fields=60,
+                 fields_per_device=12, seed=42):
+        rnd = random.Random(seed)
+        locations = locations or max(1, devices // 15)
+
+        self.fields = []
+        for fid in range(1, fields + 1):
+            self.fields.append({'fields.id': fid, 'fields.name': 'custom field %d' % fid})
+
+        self.locations = []
+        for lid in range(1, locations + 1):
+            oid = (lid % orgs) + 1
+            self.locations.append({
+                'id': lid,
+                'name': 'location%d' % lid,
+                'orgs.id': oid,
+                'orgs.name': 'org%d' % oid,
+                'suite': 'rack %d ;; dc=dc%d; row=%d' % (lid, lid % 3, lid % 20),
+            })
+
+        now = time.time()
+        self.devices = {}
+        self.device_fields = {}
+        for sid in range(1, devices + 1):
+            loc = self.locations[rnd.randrange(locations)]
+            seen = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now - rnd.randrange(30 * 86400)))
+            self.devices[sid] = {
+                'system.id': sid,
+                'system.fqdn': 'host%d.example.local' % sid,
+                'system.ip': '10.%d.%d.%d' % (sid >> 16 & 255, sid >> 8 & 255, sid & 255),
+                'system.manufacturer': rnd.choice(('Dell Inc.', 'HP', 'Lenovo', 'VMware, Inc.')),
+                'system.status': rnd.choice(('production', 'production', 'production', 'retired')),
+                'system.os_family': rnd.choice(('Debian', 'RedHat', 'Windows')),
+                'system.type': rnd.choice(('computer', 'computer', 'router', 'switch')),
+                'system.location_id': loc['id'],
+                'system.last_seen': seen,
+                'system.edited_date': seen,
+                'org_id': loc['orgs.id'],
+                'orgs.name': loc['orgs.name'],
+            }
+            self.device_fields[sid] = {}
+            for fid in rnd.sample(range(1, fields + 1), min(fields, fields_per_device)):
+                self.device_fields[sid][fid] = 'value %d-%d' % (sid, fid)
+
+        self.groups = []
+        for gid in range(1, groups + 1):
+            self.groups.append({
+                'groups.id': gid,
+                'groups.name': 'group %d' % gid,
+                'groups.description': 'synthetic group ;; group_var%d=%d' % (gid % 5, gid),
+            })
+
+    def field_rows(self):
+        for sid, fields in self.device_fields.items():
+            for fid, value in fields.items():
+                yield {'system.id': sid, 'field.fields_id': fid, 'field.value': value}
+
+    def group_members(self, gid):
+        return [d for sid, d in self.devices.items() if sid % len(self.groups) == gid - 1]
+
+
+def match(value, expr):
+    """
+    returns True if value matches the filter expression expr (see module docstring)
+    """
+    value = '' if value is None else str(value)
+    if expr.startswith('in(') and expr.endswith(')'):
+        return value in expr[3:-1].split(',')
+    if expr.startswith('!='):
+        return value != expr[2:]
+    if expr.startswith('like'):
+        return expr[4:].strip('%').lower() in value.lower()
+    for op, cmp in (('>', lambda a, b: a > b), ('<', lambda a, b: a < b)):
+        if expr.startswith(op):
+            other = expr[1:]
+            try:
+                return cmp(float(value), float(other))
+            except ValueError:
+                return cmp(value, other)
+    return value == expr
+
+
+def endpoint(method, path):
+    """
+    returns the endpoint name of a request for the stats, e.g. 'GET /groups/<id>/execute'
+    """
+    parts = ['<id>' if p.isdigit() else p for p in path[len(API_PREFIX):].split('/')]
+    return method + ' ' + '/'.join(parts)
+
+
+class FakeOpenAudit():
+    """
+    the API stand-in, serving a Dataset
+
+    latency: seconds every response gets delayed
+    session_ttl: seconds a login session is valid (0: forever)
+    gzip: compress responses if the client accepts it
+    etags: send an ETag for fields, locations and groups (and answer If-None-Match with 304)
+    """
+
+    # endpoints getting an ETag (if enabled)
+    etag_paths = ('fields', 'locations', 'groups')
+
+    def __init__(self, dataset, latency=0.0, session_ttl=0, gzip=False, etags=False):
+        self.data = dataset
+        self.latency = latency
+        self.session_ttl = session_ttl
+        self.gzip = gzip
+        self.etags = etags
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stats = {'requests': 0, 'bytes_sent': 0, 'bytes_received': 0, 'endpoints': {}}
+
+    def count(self, endpoint, received, sent):
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats['bytes_sent'] += sent
+            self.stats['bytes_received'] += received
+            self.stats['endpoints'][endpoint] = self.stats['endpoints'].get(endpoint, 0) + 1
+
+    def valid_session(self, cookie_header):
+        for part in (cookie_header or '').split(';'):
+            name, _sep, value = part.strip().partition('=')
+            if name == 'ci_session':
+                started = self.sessions.get(value)
+                if started is not None and (not self.session_ttl or time.time() - started < self.session_ttl):
+                    return True
+        return False
+
+    def handle(self, method, path, query, headers, body):
+        """
+        returns (status, extra headers, payload) for a request
+        """
+        if path == '/_stats':
+            return 200, {}, self.stats
+        if path == '/_reset':
+            self.reset()
+            return 200, {}, {}
+
+        if not path.startswith(API_PREFIX):
+            return 404, {}, {'errors': 'not found'}
+        parts = [p for p in path[len(API_PREFIX):].split('/') if p]
+
+        if parts == ['logon'] and method == 'POST':
+            sid = uuid.uuid4().hex
+            self.sessions[sid] = time.time()
+            return 200, {'Set-Cookie': 'ci_session=%s; path=/' % sid}, {'data': []}
+        if not self.valid_session(headers.get('Cookie')):
+            return 401, {}, {'errors': 'not logged in'}
+
+        params = dict(parse_qsl(query, keep_blank_values=True))
+        props = [p for p in params.get('properties', '').split(',') if p]
+        filters = [(k, v) for k, v in params.items() if k not in RESERVED_PARAMS]
+
+        if parts == ['devices'] and params.get('sub_resource') == 'field':
+            rows = self.filter_rows(self.data.field_rows(), filters)
+            return 200, {}, self.collection(rows, params, None)
+        if parts == ['devices']:
+            rows = self.filter_rows(self.data.devices.values(), filters)
+            return 200, {}, self.collection(rows, params, props)
+        if len(parts) == 2 and parts[0] == 'devices':
+            return self.device(method, int(parts[1]), params, props, body)
+        if parts == ['fields']:
+            return 200, {}, self.collection(self.data.fields, params, props)
+        if parts == ['locations']:
+            return 200, {}, self.collection(self.data.locations, params, props)
+        if parts == ['groups']:
+            return 200, {}, self.collection(self.data.groups, params, props)
+        if len(parts) == 3 and parts[0] == 'groups' and parts[2] == 'execute':
+            return 200, {}, self.collection(self.data.group_members(int(parts[1])), params, props)
+        return 404, {}, {'errors': 'not found'}
+
+    def filter_rows(self, rows, filters):
+        for row in rows:
+            if all(match(row.get(k), v) for k, v in filters):
+                yield row
+
+    def collection(self, rows, params, props):
+        rows = list(rows)
+        filtered = len(rows)
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 0)
+        rows = rows[offset:offset + limit] if limit else rows[offset:]
+        if props:
+            rows = [dict((p, r.get(p)) for p in props) for r in rows]
+        return {
+            'meta': {'filtered': filtered, 'total': filtered},
+            'data': [{'type': 'item', 'attributes': r} for r in rows],
+        }
+
+    def device(self, method, sid, params, props, body):
+        device = self.data.devices.get(sid)
+        if device is None:
+            return 404, {}, {'errors': 'device not found'}
+
+        if method == 'PATCH':
+            form = dict(parse_qsl(body.decode('utf-8'), keep_blank_values=True))
+            attributes = json.loads(form.get('data', '{}'))['data']['attributes']
+            names = dict((f['fields.name'], f['fields.id']) for f in self.data.fields)
+            for k, v in attributes.items():
+                if k in names:
+                    self.data.device_fields[sid][names[k]] = v
+                else:
+                    device['system.' + k] = v
+            return 200, {}, {'data': [{'type': 'devices', 'attributes': device}]}
+
+        attributes = dict((p, device.get(p)) for p in props) if props else dict(device)
+        payload = {
+            'meta': {'data_order': list(device)},
+            'data': [{'type': 'devices', 'attributes': attributes}],
+        }
+        if params.get('include') in ('field', 'all'):
+            # all custom fields, the ones not set for this device with an empty value
+            values = self.data.device_fields[sid]
+            payload['included'] = [
+                {'type': 'field', 'attributes': {'name': f['fields.name'], 'value': values.get(f['fields.id'], '')}}
+                for f in self.data.fields
+            ]
+        return 200, {}, payload
+
+    def handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do(self, method):
+                url = urlsplit(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                if api.latency and not url.path.startswith('/_'):
+                    time.sleep(api.latency)
+
+                status, headers, payload = api.handle(method, unquote_plus(url.path), url.query, self.headers, body)
+                content = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+                if api.etags and status == 200 and method == 'GET' and \
+                        url.path[len(API_PREFIX):].strip('/') in api.etag_paths:
+                    headers['ETag'] = '"%s"' % hashlib.sha1(content).hexdigest()
+                    if self.headers.get('If-None-Match') == headers['ETag']:
+                        status, content = 304, b''
+                if content and api.gzip and 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+                    content = gzip.compress(content, 5)
+                    headers['Content-Encoding'] = 'gzip'
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(content)
+                if not url.path.startswith('/_'):
+                    api.count(endpoint(method, url.path), length, len(content))
+
+            def do_GET(self):
+                self.do('GET')
+
+            def do_POST(self):
+                self.do('POST')
+
+            def do_PATCH(self):
+                self.do('PATCH')
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def server(self, host='127.0.0.1', port=0):
+        """
+        returns a (not yet started) http server, port 0 picks a free one (see server_address)
+        """
+        return ThreadingHTTPServer((host, port), self.handler())
+
+
+def add_arguments(parser):
+    parser.add_argument('--devices', type=int, default=10000, help='amount of devices (default: %(default)s)')
+    parser.add_argument('--locations', type=int, default=0, help='amount of locations (default: devices / 15)')
+    parser.add_argument('--orgs', type=int, default=10, help='amount of orgs (default: %(default)s)')
+    parser.add_argument('--groups', type=int, default=50, help='amount of groups (default: %(default)s)')
+    parser.add_argument('--fields', type=int, default=60, help='amount of custom fields (default: %(default)s)')
+    parser.add_argument('--fields-per-device', type=int, default=12,
+                        help='custom fields set per device (default: %(default)s)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds every response gets delayed (default: %(default)s)')
+    parser.add_argument('--session-ttl', type=float, default=0,
+                        help='seconds a login stays valid, 0 means forever (default: %(default)s)')
+    parser.add_argument('--gzip', action='store_true', help='compress responses if the client accepts it')
+    parser.add_argument('--etags', action='store_true',
+                        help='send ETags for fields, locations and groups and answer matching requests with 304')
+
+
+def from_arguments(args):
+    dataset = Dataset(devices=args.devices, locations=args.locations, orgs=args.orgs, groups=args.groups,
+                      fields=args.fields, fields_per_device=args.fields_per_device)
+    return FakeOpenAudit(dataset, latency=args.latency, session_ttl=args.session_ttl, gzip=args.gzip,
+                         etags=args.etags)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on (default: %(default)s)')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = from_arguments(args).server(args.host, args.port)
+    print('serving %d synthetic devices at http://%s:%d%s' % (args.devices, args.host, server.server_address[1], API_PREFIX))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#####################################################################################################
+#
+# Copyright:
+#   - 2023 T.Fischer <mail |at| sedi -DOT- one>
+#
+# License: GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+#
+#####################################################################################################
+"""
+Benchmark for the inventory pre-join stage (module_utils/join.py).
+
+Generates synthetic Open-AudIT devices, locations and fields and measures how
+long it takes to resolve the location and field variables of every device.
+The former nested device x location x field loops are measured as well but
+only up to --legacy-max devices as they do not finish in reasonable time above.
+
+The collection must be importable as ansible_collections.sedi.openaudit, i.e.
+either installed or checked out as <path>/ansible_collections/sedi/openaudit.
+
+usage: python3 benchmarks/join_scaling.py [--sizes 1000,10000,50000] [--legacy-max 1000]
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import argparse
+import os
+import sys
+import time
+
+# allow running from a checkout located at <path>/ansible_collections/sedi/openaudit
+_collections_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+if os.path.basename(_collections_dir) == 'ansible_collections':
+    sys.path.insert(0, os.path.dirname(_collections_dir))
+
+from ansible_collections.sedi.openaudit.plugins.module_utils.common import OA_vars as oavars  # noqa: E402
+from ansible_collections.sedi.openaudit.plugins.module_utils.join import OA_join as oajoin  # noqa: E402
+
+# ratios taken from a real world instance: 12k devices, 900 locations, ~150k field rows
+LOCATIONS_PER_DEVICE = 900.0 / 12000
+FIELDS_PER_DEVICE = 12
+FIELDS_TRANSLATE = {
+    'owner': 1,
+    'app': 2,
+    'env': 3,
+    'backup': 4,
+    'patchday': 5,
+    'free_form_vars': 6,
+}
+
+
+def synthetic_data(devices):
+    """
+    returns devices, locations, fields in the format of the Open-AudIT API
+    """
+    nloc = max(1, int(devices * LOCATIONS_PER_DEVICE))
+    locations = []
+    for lid in range(1, nloc + 1):
+        locations.append({'attributes': {
+            'id': lid,
+            'name': 'location%d' % lid,
+            'orgs.name': 'org%d' % (lid % 7),
+            'orgs.id': lid % 7,
+            'suite': 'rack %d ;; dc=dc%d; row=%d' % (lid, lid % 3, lid % 20),
+        }})
+
+    devs = []
+    fields = []
+    for sid in range(1, devices + 1):
+        devs.append({'attributes': {
+            'system.id': sid,
+            'system.fqdn': 'host%d.example.local' % sid,
+            'system.location_id': (sid % nloc) + 1,
+            'org_id': sid % 7,
+        }})
+        for fid in range(1, FIELDS_PER_DEVICE + 1):
+            fields.append({'attributes': {
+                'system.id': sid,
+                'field.fields_id': fid,
+                'field.value': 'value%d-%d' % (sid, fid),
+            }})
+    return devs, locations, fields
+
+
+def join_indexed(devices, locations, fields):
+    """
+    resolve all devices through the pre-join indexes
+    """
+    fmap = oajoin.map_field_ids(None, FIELDS_TRANSLATE)
+    fidx = oajoin.index_fields(None, fields, fmap)
+    lidx = oajoin.index_locations(None, locations)
+    hosts = {}
+    for d in devices:
+        hvars = {}
+        for k, v in oajoin.location_vars(None, lidx, d['attributes']['system.location_id']):
+            hvars[k] = v
+        for k, v in oajoin.field_vars(None, fidx, fmap, d['attributes']['system.id']):
+            hvars[k] = v
+        hosts[d['attributes']['system.fqdn']] = hvars
+    return hosts
+
+
+def join_legacy(devices, locations, fields):
+    """
+    resolve all devices the way the inventory did before the pre-join stage
+    (suite parsing left out, which makes this a lower bound)
+    """
+    hosts = {}
+    for d in devices:
+        hvars = {}
+        for loc in locations:
+            for lk, lv in oavars.locationsTranslate.items():
+                if d['attributes']['system.location_id'] != loc['attributes']['id']:
+                    continue
+                if lk != 'suite':
+                    hvars[lv] = loc['attributes'][lk]
+        for f in fields:
+            if f['attributes']['system.id'] == d['attributes']['system.id']:
+                for fk, fv in FIELDS_TRANSLATE.items():
+                    if f['attributes']['field.fields_id'] == fv and len(f['attributes']['field.value']) >= oavars.min_var_chars:
+                        hvars[fk] = f['attributes']['field.value']
+        hosts[d['attributes']['system.fqdn']] = hvars
+    return hosts
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,50000',
+                        help='comma separated list of device counts (default: %(default)s)')
+    parser.add_argument('--legacy-max', type=int, default=1000,
+                        help='largest device count the legacy nested loops get measured for (default: %(default)s)')
+    args = parser.parse_args()
+
+    print('%10s %10s %12s %14s %14s' % ('devices', 'locations', 'field rows', 'indexed [s]', 'legacy [s]'))
+    for size in [int(s) for s in args.sizes.split(',')]:
+        devices, locations, fields = synthetic_data(size)
+        indexed = timed(join_indexed, devices, locations, fields)
+        if size <= args.legacy_max:
+            legacy = '%14.3f' % timed(join_legacy, devices, locations, fields)
+        else:
+            legacy = '%14s' % 'skipped'
+        print('%10d %10d %12d %14.3f %s' % (size, len(locations), len(fields), indexed, legacy))
+
+
+if __name__ == '__main__':
+    main()
@@ -13,16 +13,140 @@ from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 
 # required imports
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
 from ansible_collections.sedi.openaudit.plugins.module_utils.common import OA_vars as oavars
 from ansible_collections.sedi.openaudit.plugins.module_utils.common import OA_get as oaget
+from ansible_collections.sedi.openaudit.plugins.module_utils.common import OA_client as oaclient
 from ansible_collections.sedi.openaudit.plugins.module_utils.device import OA_device as oadev
+from ansible_collections.sedi.openaudit.plugins.module_utils.device import OA_fields as oafields
+from ansible_collections.sedi.openaudit.plugins.module_utils.store import OA_store as oastore
+from ansible_collections.sedi.openaudit.plugins.module_utils.log import OA_log as oalog
+from ansible_collections.sedi.openaudit.plugins.module_utils.session import OA_session as oasession
+from ansible import constants as C
 from ansible.plugins.action import ActionBase
 from ansible.errors import AnsibleActionFail
-from ansible.module_utils._text import to_native
+from ansible.module_utils._text import to_native, to_bytes
+from ansible.module_utils.parsing.convert_bool import boolean
+
+# options handled by this action plugin only (i.e. not passed to the uri module)
+action_options = ('batch', 'batch_ttl', 'use_uri_module', 'from_hostvars', 'max_concurrency',
+                  'fields_cache_path', 'fields_cache_ttl', 'retries', 'retry_backoff', 'profile',
+                  'session_path', 'session_ttl')
+
+# options of the uri module the native client supports as well (see OA_client),
+# any other one requires the uri module
+client_options = ('attributes', 'validate_certs', 'timeout')
 
 
 class ActionModule(ActionBase):
 
+    def get_run_file(self, name, scheme_server, username, directory=None):
+        """
+        returns the path of a file shared by all hosts of a playbook run for the given server and user
+        (i.e. in the local temp dir of this run, which gets removed at the end of the run)
+        or in directory if set (i.e. shared between runs)
+        """
+        key = hashlib.sha1(to_bytes(scheme_server + '\n' + username)).hexdigest()
+        return os.path.join(os.path.expanduser(directory or C.DEFAULT_LOCAL_TMP), 'sedi.openaudit.set-' + name + '-' + key + '.json')
+
+    def login(self, scheme_server, username, password, module_args, tmp, task_vars, session_path=None, session_ttl=None):
+        """
+        returns a login cookie (see OA_get.logon_api)
+
+        with session_path the session gets stored there and re-used by later tasks / runs
+        as long as it is still logged in, only one of several parallel workers logs in again
+        (see OA_session)
+        """
+        if not session_path:
+            return oaget.logon_api(self, uri=scheme_server + oavars.logon_uri_path, usr=username, pw=password,
+                                   tmp=tmp, task_vars=task_vars, parsed_args=module_args)
+
+        session_file = oasession.path(self, session_path, scheme_server, username)
+        os.makedirs(os.path.dirname(session_file), 0o700, exist_ok=True)
+        with oastore.lock(self, session_file + '.lock'):
+            api_cookie = oasession.load(self, session_file, ttl=session_ttl)
+            if api_cookie and oasession.check_api(self, scheme_server, api_cookie, module_args, tmp, task_vars):
+                return api_cookie
+            if api_cookie:
+                oasession.forget(self, session_file)
+
+            api_cookie = oaget.logon_api(self, uri=scheme_server + oavars.logon_uri_path, usr=username, pw=password,
+                                         tmp=tmp, task_vars=task_vars, parsed_args=module_args)
+            oasession.save(self, session_file, api_cookie)
+        return api_cookie
+
+    def get_batch_data(self, scheme_server, username, password, module_args, tmp, task_vars, ttl,
+                       fields_cache_file, fields_cache_ttl, session_path=None, session_ttl=None):
+        """
+        returns the login cookie and the device index (fqdn -> id)
+        shared by all hosts of a playbook run (i.e. stored in the local temp dir of this run)
+        and ensures the custom field names are in fields_cache_file
+
+        only the first host fetches them, all others wait for it and use the stored result
+        """
+        batch_file = self.get_run_file('batch', scheme_server, username)
+
+        with oastore.lock(self, batch_file + '.lock'):
+            batch_data = oastore.load(self, batch_file, ttl=ttl)
+            if batch_data is None:
+                api_cookie = self.login(scheme_server, username, password, dict(module_args), tmp, task_vars,
+                                        session_path=session_path, session_ttl=session_ttl)
+                margs = dict(module_args)
+                margs['method'] = "GET"
+                margs['headers'] = {'Cookie': api_cookie}
+                margs['url'] = scheme_server + oavars.device_uri_path + "?format=json&properties=system.id,system.fqdn"
+                api_content = oaget.api(self, tmp=tmp, task_vars=task_vars, parsed_args=margs)
+                oafields.get_map(self, scheme_server, margs=margs, tmp=tmp, task_vars=task_vars,
+                                 cache_file=fields_cache_file, ttl=fields_cache_ttl)
+
+                batch_data = {
+                    'cookie': api_cookie,
+                    'devices': oadev.index_devices(self, api_content['data']),
+                }
+                oastore.save(self, batch_file, batch_data)
+
+        return batch_data
+
+    def get_devices(self, _args, task_vars):
+        """
+        returns a list of devices to update, each a dict with fqdn + fields
+
+        - from_hostvars: the fields are taken from the given variable of every host of the play
+        - attributes with multiple fqdn items: every item is a device
+          (each needs an fqdn and a fields dictionary, an fqdn must not appear twice)
+        - attributes otherwise: all items are merged into a single device (the original format)
+        raises AnsibleActionFail on invalid items
+        """
+        if _args.get('from_hostvars'):
+            devices = []
+            for h in task_vars.get('ansible_play_hosts', []):
+                hvars = task_vars['hostvars'][h]
+                if _args['from_hostvars'] in hvars:
+                    devices.append({'fqdn': h, 'fields': hvars[_args['from_hostvars']]})
+            return devices
+
+        if len([o for o in _args['attributes'] if 'fqdn' in o]) > 1:
+            devices = []
+            seen = set()
+            for i, o in enumerate(_args['attributes']):
+                if not o.get('fqdn'):
+                    raise AnsibleActionFail("Error: item %d of 'attributes' has no 'fqdn'" % i)
+                if not isinstance(o.get('fields'), dict):
+                    raise AnsibleActionFail("Error: item %d of 'attributes' (%s) has no 'fields' dictionary" % (i, o['fqdn']))
+                if o['fqdn'] in seen:
+                    raise AnsibleActionFail("Error: '%s' is given more than once in 'attributes'" % o['fqdn'])
+                seen.add(o['fqdn'])
+                devices.append(dict(o))
+            return devices
+
+        device_data = {}
+        for o in _args['attributes']:
+            for lk, v in o.items():
+                device_data[lk] = v
+        return [device_data]
+
     def run(self, tmp=None, task_vars=None):
 
         result = super(ActionModule, self).run(tmp, task_vars)
@@ -31,19 +155,8 @@ class ActionModule(ActionBase):
 
         scheme_server = _args['api_protocol'] + "://" + _args['api_server']
 
-        # while it is recommended using the internal requests module I was not able to get it work so using uri module instead
-        # from ansible.module_utils.urls import Request
-        # r = Request(validate_certs=_args['validate_certs'], cookies=oalogin_ret.cookies)
-        # moo = r.open('POST', scheme_server + oavars.logon_uri_path, data=dict(username=_args['username'],password=_args['password'])).read()
-        # = Request(headers=dict(foo='bar'))
-        # moo = url.open_url(scheme_server + oavars.logon_uri_path, validate_certs=_args['validate_certs'], cookies=oalogin_ret.cookies).read()
-        # moo = r.open('POST', scheme_server + oavars.logon_uri_path, cookies=oalogin_ret.cookies).read()
-        # moo = r.open('GET', scheme_server + oavars.locations_uri_path, cookies=oalogin_ret.cookies).read()
-        # moo = r.open('GET', scheme_server + oavars.locations_uri_path, url_username=_args['username'], url_password=_args['password']).read()
-
-        device_data = {}
         for p in _args:
-            if p == 'api_protocol' or p == 'api_server' or p == 'username' or p == 'password':
+            if p == 'api_protocol' or p == 'api_server' or p == 'username' or p == 'password' or p in action_options:
                 continue
             if p == 'collection':
                 if _args[p] == "devices":
@@ -67,39 +180,126 @@ class ActionModule(ActionBase):
 
         # parse given fields and map them according to their definitions
         try:
-            for o in _args['attributes']:
-                for lk, v in o.items():
-                    device_data[lk] = v
+            devices = self.get_devices(_args, task_vars)
+        except AnsibleActionFail:
+            raise
         except KeyError as e:
             raise AnsibleActionFail("Error: 'attributes' option is missing.\nError was: %s" % to_native(e))
         except Exception as e:
             raise AnsibleActionFail("You have not specified valid 'attributes'.\nError was: %s" % to_native(e))
+        if not devices:
+            result.update(dict(changed=False, message='No devices to update'))
+            return result
+
+        # time spent per stage + requests and bytes transferred get returned as 'profile' if enabled
+        profile = boolean(_args.get('profile', os.environ.get('OA_PROFILE', False)), strict=False)
+        oalog.start_stages(self, profile)
+
+        # talk to the API directly (one session for all calls of this task) instead of
+        # running the uri module for every call, unless explicitly requested
+        use_uri_module = boolean(_args.get('use_uri_module', False), strict=False)
+        passthrough = sorted(p for p in module_args if p not in client_options)
+        if passthrough and not use_uri_module:
+            self._display.warning("The option(s) %s are supported by the uri module only, using it for all API calls "
+                                  "(set 'use_uri_module: true' to avoid this warning)" % ', '.join(passthrough))
+            use_uri_module = True
+        if not use_uri_module:
+            try:
+                self.oa_client = oaclient(validate_certs=boolean(_args.get('validate_certs', True), strict=False),
+                                          timeout=int(_args.get('timeout', 30)),
+                                          pool_size=max(1, int(_args.get('max_concurrency', 8))),
+                                          retries=max(0, int(_args.get('retries', 3))),
+                                          backoff=float(_args.get('retry_backoff', 1.0)))
+            except ImportError as e:
+                raise AnsibleActionFail("%s\nInstall it or set 'use_uri_module: true'" % to_native(e))
+            oalog.track_session(self, self.oa_client.session)
+
+        # custom field names are cached for this run (or longer if a cache path is set)
+        fields_cache_file = self.get_run_file('fields', scheme_server, _args['username'], _args.get('fields_cache_path'))
+        fields_cache_ttl = int(_args.get('fields_cache_ttl', 86400))
+
+        # the login session can be shared between tasks and runs
+        session_path = _args.get('session_path')
+        session_ttl = int(_args.get('session_ttl', 3600))
 
+        # in batch mode login, device index and custom field names are shared by all hosts
+        batch_data = {}
         try:
-            api_cookie = oaget.logon_api(self, uri=scheme_server + oavars.logon_uri_path,
-                                         usr=_args['username'], pw=_args['password'],
-                                         tmp=tmp, task_vars=task_vars,
-                                         parsed_args=module_args)
+            if boolean(_args.get('batch', False), strict=False):
+                with oalog.stage(self, 'batch'):
+                    batch_data = self.get_batch_data(scheme_server, username=_args['username'], password=_args['password'],
+                                                     module_args=module_args, tmp=tmp, task_vars=task_vars,
+                                                     ttl=int(_args.get('batch_ttl', 300)),
+                                                     fields_cache_file=fields_cache_file, fields_cache_ttl=fields_cache_ttl,
+                                                     session_path=session_path, session_ttl=session_ttl)
+                api_cookie = batch_data['cookie']
+            else:
+                with oalog.stage(self, 'login'):
+                    api_cookie = self.login(scheme_server, _args['username'], _args['password'], module_args, tmp, task_vars,
+                                            session_path=session_path, session_ttl=session_ttl)
         except Exception as e:
             raise AnsibleActionFail("Problem occured during login\n\nError message:\n%s\n\n%s" % (to_native(e), oavars.default_error_hint))
 
-        # set cookie and target url
+        # set cookie and target url (PATCH sends its body form-urlencoded)
         module_args['method'] = "GET"
+        module_args['body_format'] = "form-urlencoded"
         module_args['headers'] = {}
         module_args['headers']['Cookie'] = api_cookie
         module_args['url'] = module_args_url
 
         # fetch data from corresponding API endpoint
-        if collection_type == "devices":
+        if collection_type == "devices" and len(devices) == 1:
+            device_data = devices[0]
             try:
                 module_return = oadev.update(self, scheme_server=scheme_server,
                                              device_data=device_data,
                                              tmp=tmp, task_vars=task_vars,
-                                             module_args=module_args)
+                                             module_args=module_args,
+                                             device_index=batch_data.get('devices'),
+                                             index_file=self.get_run_file('index', scheme_server, _args['username']),
+                                             fields_cache_file=fields_cache_file, fields_cache_ttl=fields_cache_ttl)
                 result.update(module_return)
             except Exception as e:
                 raise AnsibleActionFail("Problem occured while updating attributes for >" + device_data['fqdn']
                                         + "<\n\nError message was:\n%s\n\n%s" % (to_native(e), oavars.default_error_hint))
+        elif collection_type == "devices":
+            # many devices: resolve all ids and custom field names once, then diff + update in parallel
+            try:
+                device_index = batch_data.get('devices')
+                if device_index is None:
+                    with oalog.stage(self, 'lookup'):
+                        device_index = oadev.index_devices(self, oaget.api(self, tmp=tmp, task_vars=task_vars,
+                                                                           parsed_args=dict(module_args))['data'])
+                with oalog.stage(self, 'fields map'):
+                    oafields.get_map(self, scheme_server, margs=dict(module_args), tmp=tmp, task_vars=task_vars,
+                                     cache_file=fields_cache_file, ttl=fields_cache_ttl)
+            except Exception as e:
+                raise AnsibleActionFail("Problem occured while fetching the device list\n\nError message was:\n%s\n\n%s"
+                                        % (to_native(e), oavars.default_error_hint))
+
+            # the uri module can not be run in parallel
+            max_workers = 1 if getattr(self, 'oa_client', None) is None else max(1, int(_args.get('max_concurrency', 8)))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = []
+                for device_data in devices:
+                    futures.append((device_data['fqdn'], executor.submit(
+                        oadev.update, self, scheme_server=scheme_server, device_data=device_data,
+                        tmp=tmp, task_vars=task_vars, module_args=dict(module_args),
+                        device_index=device_index,
+                        fields_cache_file=fields_cache_file, fields_cache_ttl=fields_cache_ttl)))
+
+                result['devices'] = {}
+                for fqdn, future in futures:
+                    try:
+                        result['devices'][fqdn] = future.result()
+                    except Exception as e:
+                        result['devices'][fqdn] = dict(failed=True, msg="Problem occured while updating attributes: %s" % to_native(e))
+
+            result['changed'] = any(r.get('changed', False) for r in result['devices'].values())
+            failed = [fqdn for fqdn, r in result['devices'].items() if r.get('failed', False)]
+            if failed:
+                result['failed'] = True
+                result['msg'] = "Updating failed for: %s\n\n%s" % (', '.join(failed), oavars.default_error_hint)
         # elif collection_type == "location":
             # api_content = oaget.api(self, tmp=tmp, task_vars=task_vars, parsed_args=module_args)
         # elif collection_type == "field":
@@ -108,4 +308,7 @@ class ActionModule(ActionBase):
             # raise AnsibleActionFail("Missing required option: you must set device, location or field!")
             raise AnsibleActionFail("Missing required option: you must set >device<")
 
+        if profile:
+            result['profile'] = oalog.profile(self)
+
         return result
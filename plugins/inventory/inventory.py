@@ -20,6 +20,7 @@ description:
       maps all fields to (defined) human readable names
       and finally returns an Ansible inventory.
       It supports using custom fields in Open-AudIT which can then be used in Ansible as variables.
+      The fetched API data can be cached (see the C(cache) options) so subsequent runs do not need to contact the API at all.
       This plugin is B(not) developed by Firstwave (was Opmantek until 2021) nor has any commercial relationship between.
       It is simply a contribution to the community in the hope it is useful and of course without any warranties.
 author: Thomas Fischer (@se-di)
@@ -27,6 +28,7 @@ version_added: '1.0.0'
 requirements:
     - python3 >= '3.5'
     - python-requests >= '2.16.0'
+    - python-orjson (optional, decodes big API responses faster)
     - Open-AudIT >= '4.3.4'
 options:
     plugin:
@@ -67,6 +69,7 @@ options:
             - A dictionary of all C(Ansible variable <-> field-id) mappings.
             - Must match with the fields id which can be achieved from C(Manage->Fields) within the Open-AudIT Web UI.
             - For details & examples check the L(documentation,https://github.com/secure-diversITy/ansible_openaudit_inventory/wiki).
+            - Only the values of the mapped fields get fetched from the API. If no fields are mapped, no fields get fetched at all.
         suboptions:
             freely-selectable-variable-name:
                 description:
@@ -74,6 +77,26 @@ options:
                     - It becomes part of the hostvars for a host when you add it to a device in Open-AudIT.
                 type: int
         required: false
+    oa_device_properties:
+        description:
+            - Additional device properties to fetch, mapped to the name of the host variable they get stored in.
+            - e.g. C({'system.os_family': 'oa.os_family', 'system.type': 'oa.type'})
+            - The default properties (C(oa.id), C(oa.fqdn), C(oa.org_id), C(oa.location_id), ...) are always fetched.
+        type: dict
+        default: {}
+        required: false
+        version_added: '2.1.0'
+    oa_device_filters:
+        description:
+            - Server-side filters limiting which devices get fetched (and with them their fields).
+            - A dictionary of device property -> value. A list of values matches any of them.
+            - A value can start with an operator supported by the Open-AudIT API, e.g. C(!=) or C(like).
+            - e.g. C({'system.status': 'production', 'org_id': [2, 5]})
+            - Group memberships are limited to the fetched devices when filters are set.
+        type: dict
+        default: {}
+        required: false
+        version_added: '2.1.0'
     verify_certs:
         description: Verify the SSL certificate of the Open-AudIT api.
         aliases:
@@ -84,6 +107,180 @@ options:
         default: true
         required: false
         version_added: '1.3.0'
+    oa_max_concurrency:
+        description:
+            - Maximum number of parallel requests to the Open-AudIT API.
+            - Used when fetching the collections (devices, fields, locations, groups) and the members of all groups.
+            - Set to C(1) to fetch everything sequentially.
+        type: int
+        default: 8
+        required: false
+        version_added: '2.1.0'
+    oa_page_size:
+        description:
+            - Number of rows fetched per API request, using the C(limit) and C(offset) parameters of the API.
+            - The fields of all devices are processed page by page, so memory usage depends on this value
+              instead of the amount of devices.
+            - Set to C(0) to fetch every collection with a single request (limited by the server configuration).
+        type: int
+        default: 1000
+        required: false
+        version_added: '2.1.0'
+    oa_timeout_connect:
+        description: Seconds to wait for establishing a connection to the Open-AudIT API.
+        type: float
+        default: 10
+        required: false
+        version_added: '2.1.0'
+    oa_timeout_read:
+        description:
+            - Seconds to wait for the Open-AudIT API to send data.
+            - Big collections (e.g. the fields of all devices) can take a while to be rendered by the server.
+        type: float
+        default: 300
+        required: false
+        version_added: '2.1.0'
+    oa_retries:
+        description:
+            - How often a request gets repeated on connection errors, timeouts
+              or when the server responds with 429, 500, 502, 503 or 504.
+            - Set to C(0) to fail on the first error.
+        type: int
+        default: 3
+        required: false
+        version_added: '2.1.0'
+    oa_retry_backoff:
+        description:
+            - Base of the exponential backoff between retries in seconds, i.e. the n-th retry waits
+              C(oa_retry_backoff * 2^(n-1)) seconds plus a random jitter of up to the same amount.
+            - A C(Retry-After) header sent by the server is respected.
+        type: float
+        default: 1.0
+        required: false
+        version_added: '2.1.0'
+    oa_incremental_path:
+        description:
+            - Path to a local state file which enables incremental refreshes.
+            - When set, the fetched data and the time of the last refresh get stored there.
+              The next refresh then fetches only devices which have been seen or edited since then
+              (plus their fields) and merges them into the stored data.
+              Deleted devices are detected by fetching the ids of all devices.
+            - Locations, groups and group members are always fetched completely
+              (see C(oa_validators_path) to avoid that for locations and groups).
+            - The file gets created with mode C(0600). Remove it to force a full refresh.
+            - Open-AudIT stores timestamps in the server time zone, so the controller and the server should use the same.
+        type: path
+        required: false
+        version_added: '2.1.0'
+    oa_incremental_overlap:
+        description:
+            - Amount of seconds the last refresh time gets moved back when doing an incremental refresh.
+            - Covers clock differences between the controller and the Open-AudIT server.
+        type: int
+        default: 300
+        required: false
+        version_added: '2.1.0'
+    oa_validators_path:
+        description:
+            - Directory to keep local copies of the locations and groups (not their members) fetched from the API.
+            - When set, the validators of the responses (C(ETag), C(Last-Modified)) get stored along with them
+              and the next refresh asks the server to send them only if they have changed.
+            - If the server does not send validators, the local copies are used for C(oa_validators_ttl) seconds
+              without asking the server at all.
+            - Locations and groups are fetched in one request then (i.e. regardless of C(oa_page_size)),
+              so a local copy always is the whole collection at one point in time.
+            - The files get created with mode C(0600).
+        type: path
+        required: false
+        version_added: '2.1.0'
+    oa_validators_ttl:
+        description:
+            - Seconds the local copy of a collection (C(locations), C(groups)) gets used without asking the server,
+              if the server does not send validators (see C(oa_validators_path)). C(0) asks the server every time.
+        type: dict
+        default:
+            locations: 3600
+            groups: 3600
+        required: false
+        version_added: '2.1.0'
+    oa_session_path:
+        description:
+            - Directory to store the login session (cookie) of the API, so following runs can re-use it instead of logging in again.
+            - A stored session is checked with a cheap API call first, a new login is done if it has expired.
+            - The file is stored per server and user with mode C(0600). The password is never stored.
+        type: path
+        required: false
+        version_added: '2.1.0'
+    oa_session_ttl:
+        description:
+            - Seconds a stored login session gets re-used at most (see C(oa_session_path)). C(0) re-uses it as long as it is valid.
+        type: int
+        default: 3600
+        required: false
+        version_added: '2.1.0'
+    oa_group_shared_vars:
+        description:
+            - Store variables which are the same for many hosts once in a group instead of in every host.
+            - The variables of a location (C(oa.location), C(oa.org), C(oa.l_org_id) and the ones of its C(suite))
+              become group variables of the C(<org>__<location>) group, which gets the C(ansible_group_priority)
+              C(10) so they still win over the variables of other groups (e.g. the ones from Open-AudIT groups).
+              Location variables named like a device property stay host variables.
+            - C(dictFieldMap) becomes a variable of the group C(all).
+            - B(Changes the variable precedence.) Group variables rank below C(group_vars/all) and C(group_vars/*) files,
+              so variables defined there win over the location variables (and over C(dictFieldMap)), which they do not
+              as host variables. Only enable it if no such variables overlap.
+            - C(ansible-inventory --list) shows these variables in the groups instead of the hosts,
+              and hosts get added to their C(<org>) and C(<org>__<location>) groups even without C(oa_fieldsTranslate).
+            - Locations resulting in the same group name keep their variables per host.
+            - C(compose), C(groups) and C(keyed_groups) are evaluated using the group and host variables.
+        type: bool
+        default: false
+        required: false
+        version_added: '2.1.0'
+    oa_compose_cache:
+        description:
+            - Re-use the results of C(compose), C(groups) and C(keyed_groups) expressions for all hosts
+              having the same values for the variables an expression references
+              (e.g. C(vars['oa.org']) or C(hostvars[inventory_hostname]['oa.location'])).
+            - Expressions using C(now()), C(lookup), C(query), C(vars) or C(hostvars) other than with a constant key,
+              or filters not known to give the same result for the same input (e.g. C(random), C(shuffle),
+              C(password_hash) or filters of other collections) are evaluated for every host.
+        type: bool
+        default: true
+        required: false
+        version_added: '2.1.0'
+    oa_profile:
+        description:
+            - Print a JSON summary of the time spent per stage (login, each collection fetch, group members, join,
+              compose, constructed groups, ...) and the amount of requests and bytes transferred to stderr.
+            - The same timings are displayed (human readable) with C(-vvv).
+        type: bool
+        default: false
+        env:
+            - name: OA_PROFILE
+        required: false
+        version_added: '2.1.0'
+    oa_snapshot_path:
+        description:
+            - Path to an offline snapshot of what this plugin added to the inventory (hosts, groups and their variables).
+            - Hosts, groups and variables of other inventory sources are not part of the snapshot.
+            - The snapshot gets written after every refresh from the API and is used instead of the API
+              (and without populating the inventory again) as long as it is not older than C(oa_snapshot_max_age).
+            - Use C(--flush-cache) to ignore an existing snapshot and refresh it.
+            - The snapshot is a JSON lines file, gzip compressed if the path ends with C(.gz),
+              and gets created with mode C(0600).
+        type: path
+        required: false
+        version_added: '2.1.0'
+    oa_snapshot_max_age:
+        description:
+            - Maximum age in seconds of the snapshot set by C(oa_snapshot_path). C(0) means no limit.
+            - The age is based on the time the data has been fetched from the API
+              (i.e. a snapshot written from cached data is as old as the cache).
+        type: int
+        default: 86400
+        required: false
+        version_added: '2.1.0'
 seealso:
     - name: Plugin documentation
       description: Detailed examples and guidelines for this plugin
@@ -96,6 +293,7 @@ seealso:
       link: 'https://community.opmantek.com/display/OA/The+Open-AudIT+API'
 extends_documentation_fragment:
     - constructed
+    - inventory_cache
 """
 
 EXAMPLES = r'''
@@ -104,30 +302,68 @@ ansible-inventory -i inventories/dynamic/inventory.openaudit.yml --host srv01.fo
 
 ansible-inventory -i inventories/dynamic/inventory.openaudit.yml --list
 
+# cache the fetched data for one hour (inventories/dynamic/inventory.openaudit.yml)
+plugin: sedi.openaudit.inventory
+oa_api_server: my.openauditserver.local
+oa_api_proto: https
+cache: true
+cache_plugin: ansible.builtin.jsonfile
+cache_timeout: 3600
+cache_connection: ~/.cache/ansible/openaudit
+
+# ignore (and refresh) the cache
+ansible-inventory -i inventories/dynamic/inventory.openaudit.yml --list --flush-cache
+
+# fetch the production devices of two orgs only, including their OS family
+plugin: sedi.openaudit.inventory
+oa_api_server: my.openauditserver.local
+oa_device_properties:
+    system.os_family: oa.os_family
+oa_device_filters:
+    system.status: production
+    org_id: [2, 5]
+
+# use an offline snapshot of the whole inventory if it is not older than one day
+plugin: sedi.openaudit.inventory
+oa_api_server: my.openauditserver.local
+oa_snapshot_path: ~/.cache/ansible/openaudit/snapshot.jsonl.gz
+oa_snapshot_max_age: 86400
+
 '''
 
 # required imports
-import re
+import inspect
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from ansible_collections.sedi.openaudit.plugins.module_utils.common import OA_vars as oavars
 from ansible_collections.sedi.openaudit.plugins.module_utils.common import OA_get as oaget
-from ansible.plugins.inventory import BaseInventoryPlugin, Constructable
+from ansible_collections.sedi.openaudit.plugins.module_utils.common import OA_client as oaclient
+from ansible_collections.sedi.openaudit.plugins.module_utils.join import OA_join as oajoin
+from ansible_collections.sedi.openaudit.plugins.module_utils.parse import OA_parse as oaparse
+from ansible_collections.sedi.openaudit.plugins.module_utils.log import OA_log as oalog
+from ansible_collections.sedi.openaudit.plugins.module_utils.compose import OA_templar as oatemplar
+from ansible_collections.sedi.openaudit.plugins.module_utils.store import OA_store as oastore
+from ansible_collections.sedi.openaudit.plugins.module_utils.session import OA_session as oasession
+from ansible_collections.sedi.openaudit.plugins.module_utils.snapshot import OA_snapshot as oasnapshot
+from ansible.plugins.inventory import BaseInventoryPlugin, Constructable, Cacheable
+from ansible.inventory.helpers import get_group_vars
+from ansible.utils.vars import combine_vars
 from ansible.module_utils.six import raise_from
 from ansible.errors import AnsibleError
 from ansible.module_utils._text import to_native
+from ansible.module_utils.six.moves.urllib.parse import quote
 
 # required to satisfy sanity import test:
 try:
-    import requests
+    import requests  # noqa: F401
 except ImportError as imp_exc:
     REQUESTS_LIB_IMPORT_ERROR = imp_exc
 else:
     REQUESTS_LIB_IMPORT_ERROR = None
 
-# minimal expected length for variable / fields content
-min_var_chars = 2
-
 
-class InventoryModule(BaseInventoryPlugin, Constructable):
+class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
 
     NAME = 'sedi.openaudit.inventory'
 
@@ -149,11 +385,6 @@ class InventoryModule(BaseInventoryPlugin, Constructable):
         global oaSession
         global oa_login
 
-        # disable warning when disabling certification verification
-        if certcheck is False:
-            import urllib3
-            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
         try:
             import os
             oa_username_conf = os.environ.get('OA_USERNAME', self.get_option('oa_username'))
@@ -163,8 +394,30 @@ class InventoryModule(BaseInventoryPlugin, Constructable):
         except Exception as e:
             raise AnsibleError("Error getting credentials. Either set environment variables or setup" +
                                "the inventory file properly. Error message: %s" % to_native(e))
+        self.oa_username = oa_username_conf
+
+        # share one connection pool between all (parallel) requests
+        oaSession = oaclient.create_session(self.get_max_concurrency(), certcheck,
+                                            timeout=(self.get_option('oa_timeout_connect'), self.get_option('oa_timeout_read')),
+                                            retries=max(0, int(self.get_option('oa_retries'))),
+                                            backoff=self.get_option('oa_retry_backoff'))
+        oalog.track_session(self, oaSession)
+
+        # re-use a stored login session if it is still valid
+        session_file = None
+        if self.get_option('oa_session_path'):
+            session_file = oasession.path(self, self.get_option('oa_session_path'), base_uri, oa_username_conf)
+            cookie = oasession.load(self, session_file, self.get_option('oa_session_ttl'))
+            if cookie:
+                oaSession.cookies.update(oasession.cookies(self, cookie))
+                if oasession.check(self, oaSession, base_uri):
+                    self.display.vvv('re-using the stored login session of ' + oa_username_conf)
+                    oa_login = None
+                    return
+                self.display.vvv('the stored login session has expired, logging in again')
+                oaSession.cookies.clear()
+                oasession.forget(self, session_file)
 
-        oaSession = requests.Session()
         try:
             oa_login = oaSession.post(base_uri + oavars.logon_uri_path,
                                       data={'username': oa_username_conf, 'password': oa_password_conf},
@@ -182,31 +435,46 @@ class InventoryModule(BaseInventoryPlugin, Constructable):
                                "in your inventory or add the custom CA to your local system CA bundle. " +
                                "Error message: %s" % to_native(e))
 
+        if session_file:
+            oasession.save(self, session_file, oasession.cookie_string(self, dict((c.name, c.value) for c in oaSession.cookies)))
+
+    def get_max_concurrency(self):
+        """
+        returns the configured number of parallel API requests (at least 1)
+        """
+        try:
+            return max(1, int(self.get_option('oa_max_concurrency')))
+        except (TypeError, ValueError) as e:
+            raise AnsibleError("Invalid value for 'oa_max_concurrency': %s" % to_native(e))
+
+    def get_page_size(self):
+        """
+        returns the configured amount of rows per API request (0 means no paging)
+        """
+        try:
+            return max(0, int(self.get_option('oa_page_size')))
+        except (TypeError, ValueError) as e:
+            raise AnsibleError("Invalid value for 'oa_page_size': %s" % to_native(e))
+
     def to_valid_group_name(self, name):
         """
         we do not use to_safe_group_name from ansible.inventory.group
         as it still allows several bad chars like @ or even spaces which makes
         it harder to work with these
         """
-        sname = re.compile(r'^[\d\W]|[^\w]').sub("_", name)
-        return sname
+        return oaparse.group_name(self, name)
 
-    def parse(self, inventory, loader, path, cache=None):
+    def fetch_oa_data(self):
         """
-        parse all data and create a dictionary containing all joined data for a host
+        login to the API and fetch all collections we need
 
-        will:
-            - loop over all devices
-            - loop over all properties
-            - loop over available locations and update host vars with found location name + org
-            - loop over all fields and set all valid (see fieldsTranslate) as a hostvar
+        returns the raw API payloads as a dictionary (which is what gets cached):
+            - devices, locations, groups: as returned by the API
+            - fields: the mapped field rows only (see fetch_fields)
+            - group_members: group id (as string) -> members as returned by the groups execute call
+            - fetched: the time the data has been fetched (kept by the cache, see OA_snapshot.age)
         """
 
-        # call base method to ensure properties are available for use with other helper methods
-        super(InventoryModule, self).parse(inventory, loader, path)
-
-        self._read_config_data(path)
-
         # build first part of the uri based on the user config
         api_base_uri = self.get_option('oa_api_proto') + '://' + self.get_option('oa_api_server')
 
@@ -217,161 +485,593 @@ class InventoryModule(BaseInventoryPlugin, Constructable):
             certcheck = True
 
         # login first
-        self.login_oa(api_base_uri, certcheck)
+        with oalog.stage(self, 'login'):
+            self.login_oa(api_base_uri, certcheck)
+
+        # check for a previous state we can refresh incrementally
+        state_path = self.get_option('oa_incremental_path')
+        state = None
+        if state_path:
+            state = oastore.load(self, state_path)
+            if not state or 'synced' not in state or 'data' not in state or \
+                    state.get('signature') != self.get_state_signature(api_base_uri):
+                oalog.debug(self, 3, 'no usable incremental state found at %s, doing a full refresh', state_path)
+                state = None
+        sync_start = time.time()
+
+        # only fetch the (filtered) devices with the configured properties
+        # and the fields which are mapped (None if there are none at all)
+        devices_uri_path = self.get_devices_uri_path()
+        fields_uri_path = self.get_fields_uri_path()
+
+        # no with statement: it would wait for all queued and running requests before an error gets reported
+        executor = ThreadPoolExecutor(max_workers=self.get_max_concurrency())
+        self.oa_futures = []
+        try:
+            with oalog.stage(self, 'fetch'):
+                # fetch all collections we need, they do not depend on each other
+                page_size = self.get_page_size()
+                requests_list = [
+                    ('locations', oavars.locations_uri_path, page_size, self.get_validators('locations')),
+                    ('groups', oavars.groups_list_uri_path, page_size, self.get_validators('groups')),
+                ]
+                if state:
+                    # only devices seen or edited since the last refresh + the ids of all devices
+                    since = time.strftime('%Y-%m-%d %H:%M:%S',
+                                          time.localtime(state['synced'] - self.get_option('oa_incremental_overlap')))
+                    oalog.debug(self, 3, 'incremental refresh of devices changed since %s', since)
+                    requests_list.extend([
+                        ('listed', self.get_devices_uri_path(['system.id']), page_size),
+                        ('seen', devices_uri_path + '&system.last_seen=' + quote('>' + since), page_size),
+                        ('edited', devices_uri_path + '&system.edited_date=' + quote('>' + since), page_size),
+                    ])
+                else:
+                    requests_list.append(('devices', devices_uri_path, page_size))
+                    if fields_uri_path:
+                        requests_list.append(('fields', fields_uri_path, self.fetch_fields))
+                collections = self.submit_requests(executor, api_base_uri, requests_list)
+
+                # get all group members for all groups as soon as the group list is there
+                # (i.e. while the other collections are still being fetched)
+                # the results are stored by group id so applying them later keeps the order of oaData['groups']
+                groups = self.collect_results(api_base_uri, [c for c in collections if c[0] == 'groups'])['groups']
+                members = self.submit_requests(executor, api_base_uri, [
+                    (gid, oavars.groups_base_uri_path + '/' + gid + oavars.groups_execute_path)
+                    for gid in [str(grp['attributes']['groups.id']) for grp in groups or []]
+                ], stage='fetch group members')
+
+                oaData = self.collect_results(api_base_uri, collections)
+                if state:
+                    self.merge_incremental(executor, api_base_uri, state['data'], oaData, fields_uri_path)
+                elif not fields_uri_path:
+                    oaData['fields'] = []
+                oaData['group_members'] = self.collect_results(api_base_uri, members)
+                oaData['fetched'] = sync_start
+        except BaseException:
+            self.cancel_requests(executor)
+            raise
+        executor.shutdown()
+
+        if state_path:
+            oastore.save(self, state_path, {
+                'signature': self.get_state_signature(api_base_uri),
+                'synced': sync_start,
+                'data': {'devices': oaData['devices'], 'fields': oaData['fields']},
+            })
+
+        return oaData
+
+    def get_validators(self, collection):
+        """
+        returns the settings for conditional requests of a collection (see OA_get.oa_page)
+        or None if oa_validators_path is not set
+        """
+        path = self.get_option('oa_validators_path')
+        if not path:
+            return None
+        ttls = self.get_option('oa_validators_ttl') or {}
+        try:
+            ttl = max(0, int(ttls.get(collection, 0)))
+        except (TypeError, ValueError):
+            raise AnsibleError("oa_validators_ttl: invalid value for %s: %s" % (collection, ttls.get(collection)))
+        return {'path': path, 'user': self.oa_username, 'ttl': ttl}
+
+    def get_state_signature(self, base_uri):
+        """
+        returns everything an incremental state depends on
+        a state with a different signature can not be refreshed incrementally
+        """
+        return {
+            'server': base_uri,
+            'devices': self.get_devices_uri_path(),
+            'fields': self.get_fields_uri_path(),
+        }
+
+    def get_devices_translate(self):
+        """
+        returns the device property -> host variable mapping
+        (OA_vars.devicesTranslate extended by oa_device_properties)
+        """
+        devicesT = dict(oavars.devicesTranslate)
+        devicesT.update(self.get_option('oa_device_properties') or {})
+        return devicesT
+
+    def get_filters_query(self):
+        """
+        returns the server-side device filters (oa_device_filters) as query string
+        starting with '&' (or an empty string if no filters are set)
+        """
+        query = ''
+        for fk, fv in sorted((self.get_option('oa_device_filters') or {}).items()):
+            if isinstance(fv, (list, tuple)):
+                fv = 'in(' + ','.join(str(v) for v in fv) + ')'
+            query += '&' + quote(str(fk)) + '=' + quote(str(fv))
+        return query
+
+    def get_devices_uri_path(self, properties=None):
+        """
+        returns the uri path for the (filtered) devices
+        with the given properties or the ones of get_devices_translate
+        """
+        if properties is None:
+            properties = self.get_devices_translate()
+        return oavars.device_uri_path + '?format=json&properties=' + ','.join(properties) + self.get_filters_query()
+
+    def get_fields_uri_path(self):
+        """
+        returns the uri path for the fields of all (filtered) devices
+        filtered to the field ids mapped in oa_fieldsTranslate
+        or None if no fields are mapped (i.e. nothing needs to be fetched)
+        """
+        fTopt = self.get_option('oa_fieldsTranslate')
+        if not fTopt:
+            return None
+        field_ids = sorted(set(str(fv) for fv in fTopt.values()), key=lambda i: (len(i), i))
+        return oavars.fields_uri_path + '&field.fields_id=' + quote('in(' + ','.join(field_ids) + ')') + \
+            self.get_filters_query()
+
+    def merge_incremental(self, executor, base_uri, old_data, oaData, fields_uri_path):
+        """
+        complete an incremental refresh:
+        fetch new devices unknown so far and the fields of all changed devices
+        (fields_uri_path, see get_fields_uri_path),
+        then merge everything into the previous data (see OA_join.merge_devices)
+        """
+        listed = oaData.pop('listed')
+        changed = (oaData.pop('seen') or []) + (oaData.pop('edited') or [])
+
+        known = set(d['attributes']['system.id'] for d in old_data.get('devices') or [])
+        known.update(d['attributes']['system.id'] for d in changed)
+        missing = [d['attributes']['system.id'] for d in listed or [] if d['attributes']['system.id'] not in known]
+        if missing:
+            new = self.collect_results(base_uri, self.submit_requests(executor, base_uri, [
+                (n, self.get_devices_uri_path() + '&system.id=' + quote('in(' + ','.join(str(i) for i in chunk) + ')'))
+                for n, chunk in enumerate(self.chunks(missing))
+            ], stage='fetch new devices'))
+            for n in sorted(new):
+                changed.extend(new[n] or [])
+
+        changed_ids = sorted(set(d['attributes']['system.id'] for d in changed))
+        oalog.debug(self, 3, 'incremental refresh: %d changed or new devices', len(changed_ids))
+        fields = {}
+        if fields_uri_path:
+            fields = self.collect_results(base_uri, self.submit_requests(executor, base_uri, [
+                (n, fields_uri_path + '&system.id=' + quote('in(' + ','.join(str(i) for i in chunk) + ')'), self.fetch_fields)
+                for n, chunk in enumerate(self.chunks(changed_ids))
+            ], stage='fetch changed fields'))
+        changed_fields = []
+        for n in sorted(fields):
+            changed_fields.extend(fields[n])
+
+        with oalog.stage(self, 'incremental merge'):
+            oaData['devices'], oaData['fields'] = oajoin.merge_devices(self, old_data, listed, changed, changed_fields)
+
+    def chunks(self, items, size=100):
+        """
+        split a list into lists of at most size items (keeps the url length of filters reasonable)
+        """
+        return [items[i:i + size] for i in range(0, len(items), size)]
+
+    def fetch_fields(self, base_uri, uri_path):
+        """
+        fetch the fields of all devices page by page
+
+        the request is filtered to the mapped fields already (see get_fields_uri_path),
+        still only the rows of fields mapped in oa_fieldsTranslate are kept (see OA_join.compact_fields)
+        so the full collection never needs to be held in memory
+        """
+        fieldsMap = oajoin.map_field_ids(self, self.get_option('oa_fieldsTranslate'))
+        page_size = self.get_page_size()
+        if page_size > 0:
+            rows = []
+            for page in oaget.oa_data_pages(self, oaSession, oa_login, base_uri, uri_path, page_size):
+                oajoin.compact_fields(self, page, fieldsMap, rows)
+            return rows
+        return oajoin.compact_fields(self, oaget.oa_data(self, oaSession, oa_login, base_uri, uri_path), fieldsMap)
+
+    def submit_requests(self, executor, base_uri, requests_list, stage=None):
+        """
+        start fetching several API paths at once using the given executor
+        requests_list is a list of (key, uri path), (key, uri path, page size or fetch method)
+        or (key, uri path, page size, validators) tuples
+        a fetch method gets called with the base uri and the uri path
+        validators makes the requests conditional (see get_validators)
+        the time spent is added to the stage 'fetch <key>' (or to stage if set, see OA_log.stage)
+
+        returns a list of (key, uri path, future) tuples (see collect_results)
+        """
+        futures = []
+        for req in requests_list:
+            key, uri_path = req[0], req[1]
+            fetch = req[2] if len(req) > 2 else 0
+            validators = req[3] if len(req) > 3 else None
+            stage_name = stage or 'fetch ' + str(key)
+            if callable(fetch):
+                future = executor.submit(oalog.timed, self, stage_name, fetch, base_uri, uri_path)
+            else:
+                future = executor.submit(oalog.timed, self, stage_name,
+                                         oaget.oa_data, self, oaSession, oa_login, base_uri, uri_path, fetch, validators)
+            futures.append((key, uri_path, future))
+        self.oa_futures.extend(f[2] for f in futures)
+        return futures
+
+    def cancel_requests(self, executor):
+        """
+        cancel all requests started by submit_requests which are still queued
+        and let the executor go without waiting for the running ones (e.g. after a request failed)
+        """
+        for future in getattr(self, 'oa_futures', None) or []:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+    def collect_results(self, base_uri, futures):
+        """
+        wait for the requests started by submit_requests
+
+        returns a dictionary of key -> fetched data
+        raises AnsibleError if any of the requests failed
+        """
+        results = {}
+        for key, uri_path, future in futures:
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                raise AnsibleError("Could not fetch %s from the API at %s! Error message: %s" % (uri_path, base_uri, to_native(e)))
+        return results
+
+    def parse(self, inventory, loader, path, cache=True):
+        """
+        parse all data and create a dictionary containing all joined data for a host
+
+        will:
+            - load the snapshot if enabled and not too old (skips everything else)
+            - use the cached API data if caching is enabled and the cache is valid
+            - fetch all data from the API otherwise (and update the cache if enabled)
+            - populate the inventory (see populate)
+            - write the snapshot if enabled
+        """
+
+        # call base method to ensure properties are available for use with other helper methods
+        super(InventoryModule, self).parse(inventory, loader, path, cache)
+
+        self._read_config_data(path)
+
+        # per stage timings get displayed with -vvv (and as JSON summary if oa_profile is enabled)
+        oalog.start_stages(self, oalog.enabled(self, 3) or self.get_option('oa_profile'))
+
+        snapshot_path = self.get_option('oa_snapshot_path')
+        if snapshot_path and cache:
+            snapshot_age = oasnapshot.age(self, snapshot_path)
+            max_age = self.get_option('oa_snapshot_max_age')
+            if snapshot_age is not None and (not max_age or snapshot_age <= max_age):
+                try:
+                    with oalog.stage(self, 'snapshot load'):
+                        oasnapshot.load(self, self.inventory, snapshot_path)
+                    oalog.debug(self, 3, 'using Open-AudIT snapshot %s (%d seconds old)', snapshot_path, snapshot_age)
+                    self.report_stages()
+                    return
+                except (IOError, OSError, ValueError) as e:
+                    self.display.warning('Ignoring the Open-AudIT snapshot %s: %s' % (snapshot_path, to_native(e)))
+
+        cache_key = self.get_cache_key(path)
+        # cache may be True or False at this point to indicate if the inventory is being refreshed
+        # get the user's cache option too to see if we should save the cache if it is changing
+        user_cache_setting = self.get_option('cache')
+        attempt_to_read_cache = user_cache_setting and cache
+        cache_needs_update = user_cache_setting and not cache
+
+        oaData = None
+        if attempt_to_read_cache:
+            try:
+                with oalog.stage(self, 'cache load'):
+                    oaData = self._cache[cache_key]
+                oalog.debug(self, 3, 'using cached Open-AudIT data')
+            except KeyError:
+                # the cache has expired or does not exist yet
+                cache_needs_update = True
+
+        if oaData is None:
+            oaData = self.fetch_oa_data()
+
+        if cache_needs_update:
+            with oalog.stage(self, 'cache save'):
+                self._cache[cache_key] = oaData
+
+        # compose, groups and keyed_groups results get memoized (see OA_templar)
+        templar = self.templar
+        if self.get_option('oa_compose_cache'):
+            self.templar = oatemplar(templar)
+        try:
+            self.populate(oaData)
+        finally:
+            if self.templar is not templar:
+                oalog.debug(self, 3, 'compose cache: %d hits, %d misses', self.templar.hits, self.templar.misses)
+                self.templar = templar
+
+        if snapshot_path:
+            try:
+                with oalog.stage(self, 'snapshot save'):
+                    oasnapshot.dump(self, self.inventory, snapshot_path,
+                                    source=self.get_option('oa_api_proto') + '://' + self.get_option('oa_api_server'),
+                                    before=self.oa_inventory_before, created=oaData.get('fetched'))
+            except (IOError, OSError) as e:
+                self.display.warning('Could not write the Open-AudIT snapshot %s: %s' % (snapshot_path, to_native(e)))
 
-        # fetch all data we need
-        oaDataList = oaget.oa_data(self, oaSession, oa_login, api_base_uri, oavars.devices_uri_path)
-        oaFieldsList = oaget.oa_data(self, oaSession, oa_login, api_base_uri, oavars.fields_uri_path)
-        oaLocationsList = oaget.oa_data(self, oaSession, oa_login, api_base_uri, oavars.locations_uri_path)
-        oaGroupsList = oaget.oa_data(self, oaSession, oa_login, api_base_uri, oavars.groups_list_uri_path)
+        self.report_stages()
+
+    def report_stages(self):
+        """
+        display the stage timings with -vvv and print them as JSON summary to stderr if oa_profile is enabled
+        """
+        oalog.debug(self, 3, 'stage timings: %s', oalog.stages_summary(self))
+        if self.get_option('oa_profile'):
+            self.display.display(json.dumps(oalog.profile(self), sort_keys=True), stderr=True)
+
+    def location_group_names(self, lvars):
+        """
+        returns the names of the <org> and <org>__<location> groups for the location vars lvars
+        or None if the location has no org or name
+        """
+        lvdict = dict(lvars)
+        org = lvdict.get(oavars.oa_fields_prefix + 'org')
+        loc = lvdict.get(oavars.oa_fields_prefix + 'location')
+        if not org or not loc:
+            return None
+        return self.to_valid_group_name(org), self.to_valid_group_name(org + "__" + loc)
+
+    def index_location_groups(self, loc_index):
+        """
+        returns a <org>__<location> group name -> location id dictionary for add_location_group
+        names resulting from several locations map to None (i.e. none of them can store its vars in the group)
+        """
+        loc_groups = {}
+        for location_id in loc_index:
+            names = self.location_group_names(oajoin.location_vars(self, loc_index, location_id))
+            if names is None:
+                continue
+            if names[1] in loc_groups and loc_groups[names[1]] != location_id:
+                loc_groups[names[1]] = None
+            else:
+                loc_groups[names[1]] = location_id
+        return loc_groups
+
+    def add_location_group(self, host, location_id, lvars, loc_groups, created):
+        """
+        add host to the <org>__<location> group (and the <org> group) of its location
+        the group gets created including the location vars lvars the first time (created keeps track of that)
+        loc_groups is the result of index_location_groups
+
+        returns the group name or None if the location vars have to be set per host instead
+        (i.e. the location has no org or name or another location results in the same group name)
+        """
+        names = self.location_group_names(lvars)
+        if names is None or loc_groups.get(names[1]) != location_id:
+            return None
+
+        orggrp, grpname = names
+        if grpname not in created:
+            created.add(grpname)
+            self.inventory.add_group(grpname)
+            self.inventory.set_variable(grpname, 'ansible_group_priority', oavars.location_group_priority)
+            for lok, lov in lvars:
+                self.inventory.set_variable(grpname, lok, lov)
+
+        self.inventory.add_group(orggrp)
+        self.inventory.add_host(host, group=orggrp)
+        self.inventory.add_host(host, group=grpname)
+        return grpname
+
+    def constructed_kwargs(self, method):
+        """
+        returns the extra arguments for _add_host_to_composed_groups / _add_host_to_keyed_groups
+        (ansible < 2.11 does not support fetch_hostvars and fetches the host vars again)
+        """
+        try:
+            if 'fetch_hostvars' in inspect.signature(method).parameters:
+                return {'fetch_hostvars': False}
+        except (TypeError, ValueError):
+            pass
+        return {}
+
+    def get_combined_vars(self, host, cache):
+        """
+        returns the variables host ends up with, i.e. the vars of all its groups (and all)
+        combined with its host vars (see ansible.inventory.helpers.get_group_vars)
+        the combined group vars get cached per group combination in cache
+        """
+        h = self.inventory.hosts[host]
+        groups = h.get_groups()
+        key = tuple(g.name for g in groups)
+        gvars = cache.get(key)
+        if gvars is None:
+            allgrp = self.inventory.groups['all']
+            gvars = cache[key] = get_group_vars(groups if allgrp in groups else groups + [allgrp])
+        return combine_vars(gvars, h.get_vars())
+
+    def populate(self, oaData):
+        """
+        populate the inventory with the joined data of all hosts
+
+        will:
+            - loop over all devices
+            - loop over all properties
+            - look up the device location and update host vars with found location name + org
+            - look up all fields of the device and set all valid (see fieldsTranslate) as a hostvar
+        """
+
+        inventory = self.inventory
+        oaparse.start(self)
+        # other inventory sources share the inventory, the snapshot only keeps what is added here (see OA_snapshot.dump)
+        self.oa_inventory_before = oasnapshot.mark(self, inventory) if self.get_option('oa_snapshot_path') else None
+        oaDataList = oaData['devices'] or []
+        oaFieldsList = oaData['fields']
+        oaLocationsList = oaData['locations']
+        oaGroupsList = oaData['groups'] or []
 
         # read config + display debug info
         conf_strict = self.get_option('strict')
         conf_compose = self.get_option('compose')
         conf_hostgrps = self.get_option('groups')
         conf_keyedgrps = self.get_option('keyed_groups')
-        self.display.vvv('config_file -> compose: ' + str(conf_compose))
-        self.display.vvv('config_file -> host groups: ' + str(conf_hostgrps))
-        self.display.vvv('config_file -> keyed host groups: ' + str(conf_keyedgrps))
+        oalog.debug(self, 3, 'config_file -> compose: %s', conf_compose)
+        oalog.debug(self, 3, 'config_file -> host groups: %s', conf_hostgrps)
+        oalog.debug(self, 3, 'config_file -> keyed host groups: %s', conf_keyedgrps)
+        debug = oalog.enabled(self, 4)
+
+        # with server-side filters group members may contain devices which were not fetched
+        fetchedHosts = None
+        if self.get_option('oa_device_filters'):
+            fetchedHosts = set(d['attributes'].get('system.fqdn') for d in oaDataList)
 
         # add group based vars before locations (backwards compat) and fields
         # that way it will be possible to overwrite them by host vars (and location based won't break)
         groupsDict = {}
-        for grp in oaGroupsList:
-            grpname = self.to_valid_group_name(grp['attributes']['groups.name'])
-            self.inventory.add_group(grpname)
+        with oalog.stage(self, 'groups'):
+            for grp in oaGroupsList:
+                grpname = self.to_valid_group_name(grp['attributes']['groups.name'])
+                self.inventory.add_group(grpname)
+
+                # parse through translation items to get possible group vars
+                for gk, gv in oavars.groupsTranslate.items():
+                    if gk == "groups.id":
+                        oaGroupMembers = oaData['group_members'].get(str(grp['attributes'][gk]))
 
-            # parse through translation items to get possible group vars
-            for gk, gv in oavars.groupsTranslate.items():
-                if gk == "groups.id":
-                    # get all group members for all groups
-                    exec_uri = oavars.groups_base_uri_path + '/' + str(grp['attributes'][gk]) + oavars.groups_execute_path
-                    oaGroupMembers = oaget.oa_data(self, oaSession, oa_login, api_base_uri, exec_uri)
-
-                    # add / update a host - group mapping
-                    if oaGroupMembers:
-                        for grpm in oaGroupMembers:
-                            self.display.vvvv("processing: %s" % str(grpm['attributes']['system.fqdn']))
-                            self.inventory.add_host(grpm['attributes']['system.fqdn'], group=grpname)
-
-                # the special group description can hold one or multiple key=value pairs
-                # the indicator of where the key/values starts is ';; <key>=<value>'
-                # any whitespaces will be wiped
-                # multiple key/values must be separated by a single semicolon
-                if gk == "groups.description":
-                    if ";;" in grp['attributes'][gk]:
-                        trimmed_left = re.sub(r'.*;;', '', grp['attributes'][gk])
-                        trimmed = re.sub(r'\s', '', trimmed_left)
-                        if ";" in grp['attributes'][gk]:
-                            gvar = trimmed.split(';')
-                        elif "=" in grp['attributes'][gk]:
-                            gvar = [grp['attributes'][gk]]
-                    else:
-                        # seems the description is not used to hold variables
-                        continue
-
-                    # split multiple key/values
-                    grpdict = dict(s.split('=', 1) for s in gvar)
+                        # add / update a host - group mapping
+                        if oaGroupMembers:
+                            for grpm in oaGroupMembers:
+                                if fetchedHosts is not None and grpm['attributes']['system.fqdn'] not in fetchedHosts:
+                                    continue
+                                if debug:
+                                    oalog.debug(self, 4, 'processing: %s', grpm['attributes']['system.fqdn'])
+                                self.inventory.add_host(grpm['attributes']['system.fqdn'], group=grpname)
 
+                    # the special group description can hold one or multiple key=value pairs (see OA_parse.kv_vars)
                     # .. and add them as host variables
-                    for grpk, grpv in grpdict.items():
-                        self.inventory.set_variable(grpname, grpk, grpv)
-                        groupsDict[grpk] = grpv
+                    if gk == "groups.description":
+                        for grpk, grpv in oaparse.kv_vars(self, grp['attributes'][gk]):
+                            self.inventory.set_variable(grpname, grpk, grpv)
+                            groupsDict[grpk] = grpv
+
+        oalog.debug(self, 4, 'group variables found: %s', groupsDict)
 
-        self.display.vvvv('group variables found: ' + str(groupsDict))
+        # the host vars get passed to the constructed groups, no need to fetch them again
+        composedKwargs = self.constructed_kwargs(self._add_host_to_composed_groups)
+        keyedKwargs = self.constructed_kwargs(self._add_host_to_keyed_groups)
+
+        # shared data is stored in groups instead of every host (see add_location_group)
+        sharedVars = self.get_option('oa_group_shared_vars')
+        locGroups = {}
+        createdLocGroups = set()
+        groupVarsCache = {}
+
+        # pre-join: build lookup tables once so each device resolves by id
+        fTopt = self.get_option('oa_fieldsTranslate')
+        if fTopt and sharedVars:
+            # set field mappings as var so we can access them in other modules
+            self.inventory.set_variable('all', 'dictFieldMap', fTopt)
+        with oalog.stage(self, 'index'):
+            fieldsMap = oajoin.map_field_ids(self, fTopt)
+            fieldsIndex = oajoin.index_fields(self, oaFieldsList, fieldsMap) if fTopt else {}
+            locIndex = oajoin.index_locations(self, oaLocationsList)
+            if sharedVars:
+                locGroups = self.index_location_groups(locIndex)
+        devicesT = self.get_devices_translate()
 
         # iterate over ever device entry
         for i in oaDataList:
             hostsDict = {}
 
             # first of all get the system values and create a dict based on the translated items
-            for k in oavars.devicesTranslate:
+            for k in devicesT:
                 try:
-                    hostsDict[oavars.devicesTranslate[k]] = i['attributes'][k]
+                    hostsDict[devicesT[k]] = i['attributes'][k]
                 except Exception:
-                    self.display.vvvv('Open-AudIT Device #' + str(i['attributes']['system.id']) + " Does not have " + str(k))
+                    oalog.debug(self, 4, 'Open-AudIT Device #%s Does not have %s', i['attributes']['system.id'], k)
                     continue
 
             # add host and the base vars to the ansible inventory based on the FQDN
             host = hostsDict[oavars.oa_fields_prefix + 'fqdn']
             # handle empty FQDN (skip entry, print warning)
             if len(str(host)) < 4:
-                self.display.vvv('WARNING: host >' + host + '< with id >' + str(hostsDict[oavars.oa_fields_prefix + 'oa_id']) + '< seems not having a FQDN set')
+                oalog.debug(self, 3, 'WARNING: host >%s< with id >%s< seems not having a FQDN set',
+                            host, hostsDict.get(oavars.oa_fields_prefix + 'id'))
                 continue
             # add host to inventory list including base vars
-            self.inventory.add_host(host)
-            for dkey, dvar in hostsDict.items():
-                self.inventory.set_variable(host, dkey, dvar)
+            with oalog.stage(self, 'hosts'):
+                self.inventory.add_host(host)
+                for dkey, dvar in hostsDict.items():
+                    self.inventory.set_variable(host, dkey, dvar)
 
             # add location based vars after the new group vars but before fields mapped to a host
             # that way it will be possible to overwrite them by what's defined in the host
-            for loc in oaLocationsList:
-                if not hostsDict[oavars.oa_fields_prefix + 'location_id'] and not hostsDict[oavars.oa_fields_prefix + 'org_id']:
-                    continue
-                else:
-                    # parse through translation items to get possible location vars
-                    for lk, lv in oavars.locationsTranslate.items():
-                        if hostsDict[oavars.oa_fields_prefix + 'location_id'] != loc['attributes']['id']:
-                            continue
-                        if len(str(loc['attributes'][lk])) < min_var_chars:
-                            continue
-                        # the special location field "suite" can hold one or multiple key=value pairs
-                        # the indicator of where the key/values starts is ';; <key>=<value>'
-                        # any whitespaces will be wiped
-                        # multiple key/values must be separated by a single semicolon
-                        if lk == "suite":
-                            if ";;" in loc['attributes'][lk]:
-                                trimmed_left = re.sub(r'.*;;', '', loc['attributes'][lk])
-                                trimmed = re.sub(r'\s', '', trimmed_left)
-                                if ";" in loc['attributes'][lk]:
-                                    lvar = trimmed.split(';')
-                                elif "=" in loc['attributes'][lk]:
-                                    lvar = [loc['attributes'][lk]]
-                            else:
-                                # seems suite is not used to hold variables
-                                continue
-
-                            # split multiple key/values
-                            lodict = dict(s.split('=', 1) for s in lvar)
-                            # .. and add them as host variables
-                            for lok, lov in lodict.items():
-                                self.inventory.set_variable(host, lok, lov)
-                                hostsDict[lok] = lov
-                        else:
-                            self.inventory.set_variable(host, lv, loc['attributes'][lk])
-                            hostsDict[lv] = loc['attributes'][lk]
-
-                        self.display.vvvv('location variables found: ' + str(hostsDict))
+            with oalog.stage(self, 'join locations'):
+                if hostsDict.get(oavars.oa_fields_prefix + 'location_id') or hostsDict.get(oavars.oa_fields_prefix + 'org_id'):
+                    lvars = oajoin.location_vars(self, locIndex, hostsDict.get(oavars.oa_fields_prefix + 'location_id'))
+                    locgrp = None
+                    if sharedVars and lvars:
+                        locgrp = self.add_location_group(host, hostsDict.get(oavars.oa_fields_prefix + 'location_id'),
+                                                         lvars, locGroups, createdLocGroups)
+                    for lok, lov in lvars:
+                        # device properties win over location vars, so those can not be group vars
+                        if locgrp is None or lok in hostsDict:
+                            self.inventory.set_variable(host, lok, lov)
+                        hostsDict[lok] = lov
+                    if lvars and debug:
+                        oalog.debug(self, 4, 'location variables found: %s', hostsDict)
 
             # apply any local defined (config file) variables
             # overwrites location / group variables coming from Open-AudIT
             # can be overwritten by fields (i.e. like ansible host variables)
-            hostvars = inventory.hosts[host].get_vars()
-            self._set_composite_vars(conf_compose, hostvars, host, strict=True)
+            # hostvars is the one snapshot of the host vars used for compose and the constructed groups
+            # so everything set on the host from now on gets set in hostvars as well
+            with oalog.stage(self, 'compose'):
+                hostvars = self.get_combined_vars(host, groupVarsCache) if sharedVars else inventory.hosts[host].get_vars()
+                self._set_composite_vars(conf_compose, hostvars, host, strict=True)
+                if conf_compose:
+                    for cvar in conf_compose:
+                        if cvar in inventory.hosts[host].vars:
+                            hostvars[cvar] = inventory.hosts[host].vars[cvar]
 
-            # now walk through the list of fields
+            # now walk through the fields of this device
             # (overwrites location/site based variables from oaLocationsList)
-            fTopt = self.get_option('oa_fieldsTranslate')
             if not fTopt:
                 continue
             else:
-                for f in oaFieldsList:
-                    # proceed only when the fields matching the current host object
-                    if f['attributes']['system.id'] == i['attributes']['system.id']:
-                        for fk, fv in fTopt.items():
-                            # proceed only when the field is a supported item
-                            if f['attributes']['field.fields_id'] == fv and len(f['attributes']['field.value']) >= min_var_chars:
-                                # special handling for free form variable field (separated by semicolons)
-                                if fk == "free_form_vars" and ";" in f['attributes']['field.value']:
-                                    a = f['attributes']['field.value'].split(';')
-                                    fkdict = dict(s.split('=') for s in a)
-                                    for fdk, fdv in fkdict.items():
-                                        self.inventory.set_variable(host, fdk, fdv)
-                                else:
-                                    self.inventory.set_variable(host, fk, f['attributes']['field.value'])
-                                hostsDict[fk] = f['attributes']['field.value']
-                # set field mappings as hostvar so we can access them in other modules
-                self.inventory.set_variable(host, 'dictFieldMap', fTopt)
+                with oalog.stage(self, 'join fields'):
+                    for fk, fval in oajoin.field_vars(self, fieldsIndex, fieldsMap, i['attributes']['system.id']):
+                        # special handling for free form variable field (separated by semicolons)
+                        if fk == "free_form_vars" and ";" in fval:
+                            for fdk, fdv in oaparse.free_form_vars(self, fval):
+                                self.inventory.set_variable(host, fdk, fdv)
+                                hostvars[fdk] = fdv
+                        else:
+                            self.inventory.set_variable(host, fk, fval)
+                            hostvars[fk] = fval
+                        hostsDict[fk] = fval
+                    # set field mappings as hostvar so we can access them in other modules
+                    if not sharedVars:
+                        self.inventory.set_variable(host, 'dictFieldMap', fTopt)
+                        hostvars['dictFieldMap'] = fTopt
 
             # add hosts to their static group based on org and/or location
             # prob: atm (i.e. Open-AudIT v4.4.1) a user can select even locations NOT bound to the selected
@@ -385,18 +1085,22 @@ class InventoryModule(BaseInventoryPlugin, Constructable):
             else:
                 constructed_grp_name.append(self.to_valid_group_name(hostsDict[oavars.oa_fields_prefix + 'org']))
 
-            for cg in constructed_grp_name:
-                self.inventory.add_group(cg)
-                self.display.vvvv("adding: " + host + " to group: " + cg)
-                self.inventory.add_host(host, group=cg)
-
-            hostvars = inventory.hosts[host].get_vars()
+            with oalog.stage(self, 'hosts'):
+                for cg in constructed_grp_name:
+                    self.inventory.add_group(cg)
+                    if debug:
+                        oalog.debug(self, 4, 'adding: %s to group: %s', host, cg)
+                    self.inventory.add_host(host, group=cg)
 
             # from config file:
             # add host to composed and/or keyed groups and apply any variables defined there
-            self._add_host_to_composed_groups(conf_hostgrps, hostvars, host, strict=conf_strict)
-            self._add_host_to_keyed_groups(conf_keyedgrps, hostvars, host, strict=conf_strict)
+            with oalog.stage(self, 'constructed groups'):
+                # group_names changed by now
+                hostvars.update(inventory.hosts[host].get_magic_vars())
+                self._add_host_to_composed_groups(conf_hostgrps, hostvars, host, strict=conf_strict, **composedKwargs)
+                self._add_host_to_keyed_groups(conf_keyedgrps, hostvars, host, strict=conf_strict, **keyedKwargs)
 
-            self.display.vvvv('hostsDict: ' + str(hostsDict))
-            self.display.vvvv('hostvars: ' + str(hostvars))
-            self.display.vvvv('in groups: ' + str(inventory.hosts[host].get_groups()))
+            if debug:
+                oalog.debug(self, 4, 'hostsDict: %s', hostsDict)
+                oalog.debug(self, 4, 'hostvars: %s', hostvars)
+                oalog.debug(self, 4, 'in groups: %s', inventory.hosts[host].get_groups())
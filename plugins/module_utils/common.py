@@ -13,6 +13,61 @@ from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 
 import json
+import random
+from itertools import takewhile
+from ansible_collections.sedi.openaudit.plugins.module_utils.log import OA_log
+from ansible_collections.sedi.openaudit.plugins.module_utils.validators import OA_validators
+
+# optional, decodes big responses (e.g. the fields of all devices) much faster (see OA_get.json_loads)
+try:
+    import orjson
+except ImportError as imp_exc:
+    ORJSON_IMPORT_ERROR = imp_exc
+else:
+    ORJSON_IMPORT_ERROR = None
+
+# optional here as modules can still use the uri module (see OA_get.api)
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+except ImportError as imp_exc:
+    REQUESTS_LIB_IMPORT_ERROR = imp_exc
+else:
+    REQUESTS_LIB_IMPORT_ERROR = None
+
+    class OA_retry(Retry):
+        """
+        urllib3 Retry with an exponential backoff starting at the first retry
+        (urllib3 does not wait before it) plus a random jitter (up to the backoff time itself)
+        so parallel requests do not hit the server again all at the same time
+
+        i.e. the n-th retry waits backoff_factor * 2^(n - 1) seconds (capped at the backoff max of urllib3) plus jitter
+        """
+
+        def get_backoff_time(self):
+            # errors since the last redirect, the one causing this retry included
+            consecutive_errors = len(list(takewhile(lambda h: h.redirect_location is None, reversed(self.history))))
+            if consecutive_errors < 1 or self.backoff_factor <= 0:
+                return 0
+            backoff_max = getattr(self, 'backoff_max', None) or getattr(Retry, 'DEFAULT_BACKOFF_MAX',
+                                                                       getattr(Retry, 'BACKOFF_MAX', 120))
+            backoff = min(backoff_max, self.backoff_factor * (2 ** (consecutive_errors - 1)))
+            return backoff + random.uniform(0, backoff)
+
+    class OA_adapter(HTTPAdapter):
+        """
+        HTTPAdapter applying a default timeout to all requests which do not set one
+        """
+
+        def __init__(self, timeout=None, **kwargs):
+            self.timeout = timeout
+            super(OA_adapter, self).__init__(**kwargs)
+
+        def send(self, request, **kwargs):
+            if kwargs.get('timeout') is None:
+                kwargs['timeout'] = self.timeout
+            return super(OA_adapter, self).send(request, **kwargs)
 
 
 class OA_vars():
@@ -20,6 +75,9 @@ class OA_vars():
     # prefix to indicate special OA fields
     oa_fields_prefix = "oa."
 
+    # minimal expected length for variable / fields content
+    min_var_chars = 2
+
     # https://<server>/open-audit/index.php/devices
     # changes here likely require to change device_uri_path (add/remove properties)
     # use "oa.<fieldname>" instead of the following translation in your plays/roles
@@ -45,6 +103,10 @@ class OA_vars():
         'suite': 'oa.location_vars',
     }
 
+    # ansible_group_priority of the <org>__<location> groups holding the location vars
+    # (higher than the default of 1 so they win over the vars of other groups)
+    location_group_priority = 10
+
     # https://<server>/open-audit/index.php/groups
     groupsTranslate = {
         'groups.id': 'oa.group_id',
@@ -65,6 +127,8 @@ class OA_vars():
 
     # API paths related to logon
     logon_uri_path = '/open-audit/index.php/logon'
+    # cheap call to check if a stored session is still logged in (see OA_session)
+    session_check_uri_path = '/open-audit/index.php/devices?format=json&properties=system.id&limit=1'
     # API paths related to devices collection
     device_uri_path = '/open-audit/index.php/devices'
     devices_properties_path = '?format=json&properties=' + devicesproperties
@@ -93,14 +157,127 @@ class OA_vars():
     documentation_link = "https://github.com/secure-diversITy/ansible_openaudit/wiki"
 
 
+class OA_client():
+    """
+    controller side http client for the Open-AudIT API
+
+    keeps one session for all calls, i.e. connections (keep-alive) and cookies
+    get re-used instead of running the uri module (and a new TLS handshake) for every call
+    """
+
+    # status codes worth trying again (rate limiting, temporary server side issues)
+    retry_status_codes = (429, 500, 502, 503, 504)
+
+    # the API returns highly repetitive json which compresses very well
+    accept_encoding = 'gzip, deflate'
+
+    def __init__(self, validate_certs=True, timeout=30, pool_size=10, retries=3, backoff=1.0):
+        if REQUESTS_LIB_IMPORT_ERROR:
+            raise ImportError("missing a required python lib: 'requests' (%s)" % REQUESTS_LIB_IMPORT_ERROR)
+        self.timeout = timeout
+        self.session = OA_client.create_session(pool_size, validate_certs, timeout=timeout, retries=retries, backoff=backoff)
+
+    @staticmethod
+    def create_session(pool_size=10, validate_certs=True, timeout=None, retries=0, backoff=1.0):
+        """
+        returns a requests session with a connection pool of pool_size connections per host
+
+        timeout: default timeout of all requests in seconds, either one value or a (connect, read) tuple
+        retries: how often a request gets repeated on connection errors, timeouts or a status code
+                 of retry_status_codes, waiting backoff * 2^(retry - 1) seconds (plus jitter) in between
+        """
+        # disable warning when disabling certification verification
+        if validate_certs is False:
+            import urllib3
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+        retry_args = dict(total=retries, connect=retries, read=retries, status=retries,
+                          backoff_factor=backoff, status_forcelist=OA_client.retry_status_codes,
+                          raise_on_status=False)
+        methods = frozenset(['GET', 'POST', 'PATCH'])
+        try:
+            retry = OA_retry(allowed_methods=methods, **retry_args)
+        except TypeError:
+            # urllib3 < 1.26
+            retry = OA_retry(method_whitelist=methods, **retry_args)
+
+        session = requests.Session()
+        session.verify = validate_certs
+        # requests asks for compression by default already, make sure it stays that way
+        if 'gzip' not in (session.headers.get('Accept-Encoding') or ''):
+            session.headers['Accept-Encoding'] = OA_client.accept_encoding
+        for scheme in ('http://', 'https://'):
+            session.mount(scheme, OA_adapter(timeout=timeout, max_retries=retry,
+                                             pool_connections=pool_size, pool_maxsize=pool_size))
+        return session
+
+    def cookies_string(self):
+        """
+        returns the session cookies in the format of a Cookie header
+        """
+        return '; '.join('%s=%s' % (c.name, c.value) for c in self.session.cookies)
+
+    def call(self, module_args):
+        """
+        do an API call based on uri module arguments (url, method, headers, body, body_format)
+        returns the response
+        raises ValueError if the status code is not 200
+        """
+        method = module_args.get('method', 'GET')
+        headers = dict(module_args.get('headers') or {})
+        # a GET never has a body (i.e. a left over login body must not be sent again)
+        body = module_args.get('body') if method != 'GET' else None
+        if module_args.get('body_format') == 'form-urlencoded' and body is not None and not isinstance(body, dict):
+            headers.setdefault('Content-Type', 'application/x-www-form-urlencoded')
+
+        resp = self.session.request(method, module_args['url'],
+                                    headers=headers, data=body, timeout=self.timeout)
+        if resp.status_code != 200:
+            raise ValueError("Status code was %s and not [200]: %s %s" % (resp.status_code, method, module_args['url']))
+        return resp
+
+
 class OA_get():
 
+    # responses bigger than this should have been compressed by the server (see check_encoding)
+    uncompressed_warn_size = 64 * 1024
+
+    @staticmethod
+    def json_loads(data):
+        """
+        decode json directly from the response bytes (no intermediate str)
+        using orjson if installed, the json module otherwise
+        """
+        if ORJSON_IMPORT_ERROR is None:
+            return orjson.loads(data)
+        try:
+            return json.loads(data)
+        except TypeError:
+            # python < 3.6 accepts str only
+            return json.loads(data.decode('utf-8'))
+
+    def check_encoding(self, resp, uri_path):
+        """
+        count compressed / uncompressed responses of a requests session and tell (once, with -vvv)
+        if the server sends big responses uncompressed although compression has been requested
+        """
+        encoding = resp.headers.get('Content-Encoding')
+        if encoding and encoding != 'identity':
+            OA_log.count(self, 'responses_compressed')
+            return
+        OA_log.count(self, 'responses_uncompressed')
+        if len(resp.content) >= OA_get.uncompressed_warn_size and not getattr(self, 'oa_uncompressed_warned', False):
+            self.oa_uncompressed_warned = True
+            OA_log.debug(self, 3, 'the server sent %d bytes uncompressed (%s), enabling gzip on the web server '
+                         'speeds up the transfer a lot', len(resp.content), uri_path)
+
     def logon_api(self, uri, usr, pw, task_vars, tmp, parsed_args):
         """
         logon to the API with username + password
         returns a valid authentication cookie
+        parsed_args are not changed (the login body must not end up in other calls)
         """
-        module_args = parsed_args
+        module_args = dict(parsed_args)
         module_args['method'] = "POST"
         module_args['body_format'] = "form-urlencoded"
         module_args['body'] = {}
@@ -109,7 +286,17 @@ class OA_get():
         module_args['body']['enter'] = "Submit"
         module_args['url'] = uri
 
+        # use the native client if the caller has one
+        client = getattr(self, 'oa_client', None)
+        if client is not None:
+            try:
+                client.call(module_args)
+            except Exception as e:
+                raise ValueError("Could not login to the API at %s. Error message: %s" % (uri, e))
+            return client.cookies_string()
+
         try:
+            OA_log.count(self, 'requests')
             module_return = self._execute_module(module_name='ansible.legacy.uri',
                                                  module_args=module_args,
                                                  task_vars=task_vars, tmp=tmp)
@@ -120,17 +307,33 @@ class OA_get():
 
         return module_return['cookies_string']
 
-    def api(self, task_vars, tmp, parsed_args):
+    def api(self, task_vars, tmp, parsed_args, validators_path=None):
         """
         do any API call based on the URI module
         so supports whatever the URI module supports
+        (or based on the native client if the caller has one, see OA_client)
+        validators_path makes GETs of the native client conditional (see OA_validators)
         returns the content as json object
         """
         module_args = parsed_args
+
+        client = getattr(self, 'oa_client', None)
+        if client is not None:
+            try:
+                if validators_path and module_args.get('method', 'GET') == 'GET':
+                    return OA_get.conditional_call(self, client, module_args, validators_path)
+                resp = client.call(module_args)
+                OA_get.check_encoding(self, resp, module_args['url'])
+                return OA_get.json_loads(resp.content)
+            except Exception as e:
+                raise ValueError("API call error: %s" % e)
+
         try:
+            OA_log.count(self, 'requests')
             module_return = self._execute_module(module_name='ansible.legacy.uri',
                                                  module_args=module_args,
                                                  task_vars=task_vars, tmp=tmp)
+            OA_log.count(self, 'bytes_received', int(module_return.get('content_length') or 0))
 
             if 'failed' in module_return or module_return['status'] != 200:
                 raise ValueError("API call error: %s" % module_return['msg'])
@@ -139,27 +342,106 @@ class OA_get():
 
         return module_return['json']
 
-    def oa_data(self, oaSession, oa_login, base_uri, uri_path):
+    def conditional_call(self, client, module_args, validators_path):
         """
-        inventory only. Use api() for modules (see above)
-        fetches data from given api url
+        GET based on uri module arguments (url, headers) using the native client
+        sending the validators of the local copy in validators_path (see OA_validators)
+        returns the content as json object
+        """
+        url = module_args['url']
+        resp, data = OA_validators.get(self, client.session, url, validators_path,
+                                       headers=module_args.get('headers'), timeout=client.timeout)
+        if data is None:
+            if resp.status_code != 200:
+                raise ValueError("Status code was %s and not [200]: GET %s" % (resp.status_code, url))
+            OA_get.check_encoding(self, resp, url)
+            data = OA_get.json_loads(resp.content)
+            OA_validators.save(self, validators_path, url, resp, data)
+        return data
+
+    def oa_page(self, oaSession, oa_login, base_uri, uri_path, validators=None):
+        """
+        inventory only
+        fetches one response from given api url
+        oa_login is the login response or None if the session cookies of oaSession are used (see OA_session)
+        validators (a dictionary of path, user and ttl) makes the request conditional (see OA_validators)
+        returns a tuple of the data list and the meta dictionary of the response
         """
 
         self.display.vvvv('checking the following remote uri: ' + uri_path)
 
-        OAdata = oaSession.get(base_uri + uri_path, cookies=oa_login.cookies)
-        jsonData = json.loads(OAdata.text)
+        cookies = oa_login.cookies if oa_login is not None else None
+        jsonData = None
+        if validators:
+            validators_path = OA_validators.path(self, validators['path'], base_uri, validators['user'], uri_path)
+            OAdata, jsonData = OA_validators.get(self, oaSession, base_uri + uri_path, validators_path,
+                                                 validators.get('ttl'), cookies=cookies)
+        else:
+            OAdata = oaSession.get(base_uri + uri_path, cookies=cookies)
+
+        if jsonData is None:
+            if OAdata.status_code != 200:
+                raise Exception("Could not access %s (status code: %s)! Check servername and credentials..."
+                                % (uri_path, OAdata.status_code))
+
+            OA_get.check_encoding(self, OAdata, uri_path)
+            try:
+                jsonData = OA_get.json_loads(OAdata.content)
+            except ValueError as e:
+                raise Exception("Invalid response from %s (no valid json): %s" % (uri_path, e))
+            if validators:
+                OA_validators.save(self, validators_path, base_uri + uri_path, OAdata, jsonData)
         jsonDataList = jsonData['data']
 
-        if OAdata.status_code != 200:
-            raise Exception("Could not access %s ! Check servername and credentials..." % uri_path)
-
         # Check again if we have valid data
         if jsonDataList:
             for resp in jsonDataList:
                 if resp is False:
                     raise Exception("Error while accessing the API")
 
+        return jsonDataList, jsonData.get('meta') or {}
+
+    def oa_data_pages(self, oaSession, oa_login, base_uri, uri_path, page_size):
+        """
+        inventory only
+        fetches data from given api url page by page using the limit/offset parameters
+        yields the data list of each page so big collections can be processed incrementally
+        """
+        offset = 0
+        sep = '&' if '?' in uri_path else '?'
+        while True:
+            page, meta = OA_get.oa_page(self, oaSession, oa_login, base_uri,
+                                        uri_path + sep + 'limit=' + str(page_size) + '&offset=' + str(offset))
+            if not page:
+                return
+            yield page
+
+            offset += len(page)
+            # prefer the amount of matching rows reported by the server as it might cap the limit
+            try:
+                if offset >= int(meta['filtered']):
+                    return
+            except (KeyError, TypeError, ValueError):
+                if len(page) < page_size:
+                    return
+
+    def oa_data(self, oaSession, oa_login, base_uri, uri_path, page_size=0, validators=None):
+        """
+        inventory only. Use api() for modules (see above)
+        fetches data from given api url
+        a page_size > 0 fetches the data in pages (see oa_data_pages)
+        validators makes the request conditional (see oa_page), the collection gets fetched in one request then
+        so the local copy is always the whole collection at one point in time (i.e. not pages of different times)
+        """
+
+        if page_size > 0 and not validators:
+            jsonDataList = []
+            for page in OA_get.oa_data_pages(self, oaSession, oa_login, base_uri, uri_path, page_size):
+                jsonDataList.extend(page)
+        else:
+            jsonDataList = OA_get.oa_page(self, oaSession, oa_login, base_uri, uri_path, validators)[0]
+
+        if jsonDataList:
             return jsonDataList
         else:
             return
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+#####################################################################################################
+#
+# Copyright:
+#   - 2023 T.Fischer <mail |at| sedi -DOT- one>
+#
+# License: GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+#
+#####################################################################################################
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import copy
+import json
+
+try:
+    from jinja2 import meta, nodes
+except ImportError as imp_exc:
+    JINJA2_IMPORT_ERROR = imp_exc
+else:
+    JINJA2_IMPORT_ERROR = None
+
+# globals giving a different result for the same input
+# (or like vars / hostvars depending on all variables, unless used with a constant key, see scoped_references)
+VOLATILE_NAMES = frozenset(['now', 'lookup', 'query', 'q', 'lipsum', 'vars', 'hostvars'])
+
+# filters giving the same result for the same input (used as is or as ansible.builtin.<name>)
+# templates using any other filter (e.g. random, shuffle, random_mac, password_hash, strftime
+# or filters of other collections) get rendered every time
+PURE_FILTERS = frozenset([
+    # jinja2
+    'abs', 'attr', 'batch', 'capitalize', 'center', 'count', 'd', 'default', 'dictsort', 'e', 'escape',
+    'filesizeformat', 'first', 'float', 'forceescape', 'format', 'groupby', 'indent', 'int', 'items', 'join',
+    'last', 'length', 'list', 'lower', 'map', 'max', 'min', 'reject', 'rejectattr', 'replace', 'reverse',
+    'round', 'safe', 'select', 'selectattr', 'slice', 'sort', 'string', 'striptags', 'sum', 'title', 'tojson',
+    'trim', 'truncate', 'unique', 'upper', 'urlencode', 'wordcount', 'wordwrap', 'xmlattr',
+    # ansible.builtin
+    'b64decode', 'b64encode', 'basename', 'bool', 'checksum', 'combine', 'comment', 'dict2items', 'difference',
+    'dirname', 'extract', 'flatten', 'from_json', 'from_yaml', 'from_yaml_all', 'hash', 'human_readable',
+    'human_to_bytes', 'intersect', 'items2dict', 'log', 'mandatory', 'md5', 'pow', 'quote', 'regex_escape',
+    'regex_findall', 'regex_replace', 'regex_search', 'root', 'sha1', 'split', 'splitext', 'subelements',
+    'symmetric_difference', 'ternary', 'to_datetime', 'to_json', 'to_nice_json', 'to_nice_yaml', 'to_uuid',
+    'to_yaml', 'type_debug', 'union', 'urlsplit', 'win_basename', 'win_dirname', 'win_splitdrive', 'zip',
+    'zip_longest',
+])
+
+
+class OA_templar():
+    """
+    memoizing proxy of an ansible Templar used for compose, groups and keyed_groups
+
+    these templates (see Constructable) get rendered for every host, although most of them
+    only depend on a few variables which are the same for many hosts (e.g. org or location).
+    so every template gets parsed once to find the variables it references and its result
+    gets re-used for all hosts having the same values for these variables.
+
+    templates using volatile globals (e.g. now(), lookup or vars[name]) or filters not known to be pure
+    (see PURE_FILTERS, e.g. random) are always rendered,
+    as are templates referencing a variable whose value is a template itself (e.g. ansible_host={{ oa.ip }}),
+    as the Templar resolves those using other variables of the host.
+    rendering itself is left to the Templar, so its semantics (undefined handling, native types, ..) stay the same.
+    """
+
+    # results kept per template, the template is rendered every time once reached
+    max_results = 10000
+
+    # globals giving access to the variables of the host (see scoped_references)
+    scope_names = frozenset(['vars', 'hostvars'])
+
+    def __init__(self, templar):
+        object.__setattr__(self, '_templar', templar)
+        # template -> referenced variable names (None: do not memoize)
+        object.__setattr__(self, '_refs', {})
+        # template -> {variable values: result}
+        object.__setattr__(self, '_results', {})
+        object.__setattr__(self, 'hits', 0)
+        object.__setattr__(self, 'misses', 0)
+
+    def __getattr__(self, name):
+        return getattr(self._templar, name)
+
+    def __setattr__(self, name, value):
+        # e.g. available_variables
+        setattr(self._templar, name, value)
+
+    def references(self, data):
+        """
+        returns the variable names a template references
+        or None if the template can not be memoized
+        """
+        if data not in self._refs:
+            refs = None
+            if JINJA2_IMPORT_ERROR is None and isinstance(data, str):
+                try:
+                    ast = self._templar.environment.parse(data)
+                    names = meta.find_undeclared_variables(ast)
+                    if names & OA_templar.scope_names:
+                        scoped = self.scoped_references(ast)
+                        if scoped is not None:
+                            names = (names - OA_templar.scope_names) | scoped
+                    pure = all(self.is_pure_filter(f.name) for f in ast.find_all(nodes.Filter))
+                    if pure and not names & VOLATILE_NAMES:
+                        refs = tuple(sorted(names))
+                except Exception:
+                    refs = None
+            self._refs[data] = refs
+        return self._refs[data]
+
+    def is_pure_filter(self, name):
+        """
+        returns True if the filter name (e.g. lower or ansible.builtin.lower) is in PURE_FILTERS
+        """
+        if name.startswith('ansible.builtin.'):
+            name = name[len('ansible.builtin.'):]
+        return name in PURE_FILTERS
+
+    def scoped_references(self, ast):
+        """
+        returns the variable names referenced with a constant key of vars or hostvars[inventory_hostname]
+        (e.g. vars['oa.org'], the only way to reach variables having a dot in their name)
+        or None if vars / hostvars are used any other way (e.g. vars[name] or hostvars['other.host'])
+        """
+        refs = set()
+        scopes = set()
+        for node in ast.find_all((nodes.Getitem, nodes.Getattr)):
+            if isinstance(node, nodes.Getattr):
+                key = node.attr
+            elif isinstance(node.arg, nodes.Const) and isinstance(node.arg.value, str):
+                key = node.arg.value
+            else:
+                continue
+            scope = node.node
+            if isinstance(scope, nodes.Getitem) and isinstance(scope.node, nodes.Name) and scope.node.name == 'hostvars' \
+                    and isinstance(scope.arg, nodes.Name) and scope.arg.name == 'inventory_hostname':
+                # inventory_hostname is an undeclared variable (i.e. referenced) itself
+                scope = scope.node
+            elif not isinstance(scope, nodes.Name) or scope.name != 'vars':
+                continue
+            scopes.add(id(scope))
+            refs.add(key)
+        if any(n.name in OA_templar.scope_names and id(n) not in scopes for n in ast.find_all(nodes.Name)):
+            return None
+        return refs
+
+    def has_template(self, value):
+        """
+        returns True if value is (or contains) a template the Templar would resolve
+        """
+        if isinstance(value, str):
+            if '{{' not in value and '{%' not in value and '{#' not in value:
+                return False
+            try:
+                return self._templar.is_template(value)
+            except Exception:
+                return True
+        if isinstance(value, dict):
+            return any(self.has_template(k) or self.has_template(v) for k, v in value.items())
+        if isinstance(value, (list, tuple, set)):
+            return any(self.has_template(v) for v in value)
+        return False
+
+    def freeze(self, value):
+        """
+        returns a hashable representation of value (the type is part of it, i.e. 1 != True != '1')
+        """
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return (type(value).__name__, value)
+        try:
+            return ('json', json.dumps(value, sort_keys=True, default=repr))
+        except (TypeError, ValueError):
+            return ('repr', repr(value))
+
+    def template(self, variable, *args, **kwargs):
+        """
+        Templar.template, memoized by the values of the variables the template references
+        """
+        refs = self.references(variable)
+        if refs is None:
+            return self._templar.template(variable, *args, **kwargs)
+
+        available = self._templar.available_variables
+        if any(self.has_template(available[name]) for name in refs if name in available):
+            return self._templar.template(variable, *args, **kwargs)
+        key = (tuple(self.freeze(available.get(name)) if name in available else ('undefined',) for name in refs),
+               args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            # e.g. overrides passed as dictionary
+            return self._templar.template(variable, *args, **kwargs)
+
+        results = self._results.setdefault(variable, {})
+        if key in results:
+            object.__setattr__(self, 'hits', self.hits + 1)
+            result = results[key]
+        else:
+            object.__setattr__(self, 'misses', self.misses + 1)
+            result = self._templar.template(variable, *args, **kwargs)
+            if len(results) < self.max_results:
+                results[key] = result
+        # do not share mutable results between hosts
+        if isinstance(result, (dict, list)):
+            return copy.deepcopy(result)
+        return result
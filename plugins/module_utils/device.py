@@ -13,10 +13,84 @@ from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 
 import json
+import os
+import threading
 from ansible.module_utils._text import to_native
+from ansible.module_utils.six.moves.urllib.parse import quote
 from ansible_collections.sedi.openaudit.plugins.module_utils.common import OA_vars as oavars
 from ansible_collections.sedi.openaudit.plugins.module_utils.common import OA_get as oaget
 from ansible_collections.sedi.openaudit.plugins.module_utils.common import OA_misc as oamisc
+from ansible_collections.sedi.openaudit.plugins.module_utils.store import OA_store as oastore
+from ansible_collections.sedi.openaudit.plugins.module_utils.log import OA_log as oalog
+
+
+class OA_fields():
+    """
+    custom(!) field id <-> name resolution
+
+    the field definitions rarely change so they get fetched once per process
+    and can be shared using a local cache file
+    """
+
+    # server -> field map (see build_map)
+    maps = {}
+
+    # servers whose field map has been refreshed by this process already (see get_map)
+    refreshed = set()
+    refresh_lock = threading.Lock()
+
+    def build_map(self, mf_ret):
+        """
+        build the id -> name ("names") and name -> id ("ids") dictionaries from the fields collection
+        ids are used as strings as the map gets stored as json
+        """
+        fmap = {'names': {}, 'ids': {}}
+        for f in mf_ret['data']:
+            fmap['names'][str(f['attributes']['fields.id'])] = f['attributes']['fields.name']
+            fmap['ids'][f['attributes']['fields.name']] = f['attributes']['fields.id']
+        return fmap
+
+    def get_map(self, scheme_server, margs, tmp, task_vars, cache_file=None, ttl=None, refresh=False):
+        """
+        returns the field map of a server (see build_map)
+        looked up in memory first, then in cache_file (if not older than ttl seconds)
+        and fetched from the API otherwise (which updates memory and cache_file)
+        refresh skips memory and cache_file (e.g. when an unknown field id has been seen),
+        once per server and process only: the field ids stay unknown until the next run then
+
+        with the native client the fetch is a conditional request (see OA_validators)
+        based on the response stored next to cache_file, i.e. the server sends them only if they have changed
+        """
+        if refresh:
+            # parallel updates hitting the same unknown id wait for a single refresh
+            with OA_fields.refresh_lock:
+                if scheme_server in OA_fields.refreshed and scheme_server in OA_fields.maps:
+                    return OA_fields.maps[scheme_server]
+                fmap = OA_fields.fetch_map(self, scheme_server, margs, tmp, task_vars, cache_file)
+                OA_fields.refreshed.add(scheme_server)
+                return fmap
+
+        fmap = OA_fields.maps.get(scheme_server)
+        if fmap is None and cache_file:
+            fmap = oastore.load(self, cache_file, ttl=ttl)
+        if fmap is not None:
+            OA_fields.maps[scheme_server] = fmap
+            return fmap
+        return OA_fields.fetch_map(self, scheme_server, margs, tmp, task_vars, cache_file)
+
+    def fetch_map(self, scheme_server, margs, tmp, task_vars, cache_file=None):
+        """
+        fetches the field map of a server from the API, updates memory and cache_file
+        """
+        margs['method'] = "GET"
+        margs['url'] = scheme_server + oavars.fields_names_uri_path
+        validators_path = os.path.splitext(cache_file)[0] + '-validators.json' if cache_file else None
+        fmap = OA_fields.build_map(self, oaget.api(self, tmp=tmp, task_vars=task_vars, parsed_args=margs,
+                                                   validators_path=validators_path))
+        OA_fields.maps[scheme_server] = fmap
+        if cache_file:
+            oastore.save(self, cache_file, fmap)
+        return fmap
 
 
 class OA_device():
@@ -40,23 +114,41 @@ class OA_device():
         except Exception as e:
             raise e
 
-    def map_id(self, field, dfm, mf_ret):
+    def index_devices(self, data):
+        """
+        build a fqdn -> device id index from the given device data
+        (the first device wins if a fqdn is used multiple times, see parse_device_data)
         """
-        return a translated field name based on its id
+        idx = {}
+        for a in data or []:
+            idx.setdefault(a['attributes']['system.fqdn'], a['attributes']['system.id'])
+        return idx
+
+    def map_id(self, field, dfm, fmap):
+        """
+        return a translated field name based on its id (fmap, see OA_fields.build_map)
         return None if no mapping was found
         """
-        for fm, fv in dfm.items():
-            if fm == field:
-                for f in mf_ret['data']:
-                    # if we have a match for the field id set trans_k and go on
-                    if fv is f['attributes']['fields.id']:
-                        trans_k = f['attributes']['fields.name']
-                        return trans_k
-        return None
+        fv = (dfm or {}).get(field)
+        if fv is None:
+            return None
+        return fmap['names'].get(str(fv))
 
-    def cmp_field_prop(self, fname, tname, fvalue, margs, did, server, tmp, task_vars):
+    def fetch_device(self, margs, did, server, props, tmp, task_vars):
         """
-        compare a given field value with the API result
+        fetch a single device once including all given properties and all its custom fields
+        returns the full API response (properties in "data", custom fields in "included")
+        """
+        # devices/20?format=json&include=field&properties=system.status
+        margs['url'] = server + oavars.device_uri_path + '/' + did + '?format=json&include=field'
+        if props:
+            margs['url'] += '&properties=' + ','.join(props)
+
+        return oaget.api(self, parsed_args=margs, task_vars=task_vars, tmp=tmp)
+
+    def cmp_field_prop(self, device, fname, tname, fvalue):
+        """
+        compare a given field value with the fetched device (see fetch_device)
         returns true if it is identical and false if not
         will return "None" if no match found as well - which actually should not happen at all
         """
@@ -64,19 +156,7 @@ class OA_device():
         # depending on if the requested field is a special attribute or a custom field
         # handle it accordingly
         if tname is not None:
-            array = "data"
-            margs['url'] = server + oavars.device_uri_path + '/' + did + '?format=json&properties=' + tname
-        else:
-            array = "included"
-            # devices/20?format=json&include=field&properties=system.status
-            margs['url'] = server + oavars.device_uri_path + '/' + did + '?format=json&include=field'
-
-        # fetch in the right context
-        ret = oaget.api(self, parsed_args=margs, task_vars=task_vars, tmp=tmp)
-
-        # return true or false depending on if it the fetched value differs
-        if tname is not None:
-            for f in ret[array]:
+            for f in device.get('data') or []:
                 for i, v in f['attributes'].items():
                     if i == tname:
                         if fvalue == v:
@@ -86,8 +166,8 @@ class OA_device():
                             # print("changed: %s -> %s" % (tname, fvalue))
                             return False
         else:
-            for f in ret[array]:
-                if fname == f['attributes']['name']:
+            for f in device.get('included') or []:
+                if fname == f['attributes'].get('name'):
                     # print("found fname match")
                     if fvalue == f['attributes']['value']:
                         # print("not changed: %s" % fname)
@@ -98,19 +178,51 @@ class OA_device():
 
         return None
 
-    def update(self, scheme_server, task_vars, module_args, tmp, device_data):
+    def lookup_device_id(self, module_args, fqdn, tmp, task_vars, index_file=None):
+        """
+        find the device id of a fqdn by letting the server filter the device list (module_args['url'])
+        if the server does not support filtering (i.e. returns other devices as well)
+        the returned device list gets stored as fqdn -> id index in index_file (if set)
+        and gets used for all further lookups instead
+        returns the device id
+        """
+        if index_file:
+            device_index = oastore.load(self, index_file)
+            if device_index and fqdn in device_index:
+                return device_index[fqdn]
+
+        module_args['url'] = module_args['url'] + '&system.fqdn=' + quote(fqdn)
+        api_content = oaget.api(self, tmp=tmp, task_vars=task_vars, parsed_args=module_args)
+        parsed_device_data = OA_device.parse_device_data(self, data=api_content['data'], fqdn=fqdn)
+
+        if index_file:
+            for a in api_content['data']:
+                if a['attributes']['system.fqdn'] != fqdn:
+                    # filter not supported, keep the full list for the next lookups
+                    oastore.save(self, index_file, OA_device.index_devices(self, api_content['data']))
+                    break
+
+        return parsed_device_data['system.id']
+
+    def update(self, scheme_server, task_vars, module_args, tmp, device_data, device_index=None,
+               index_file=None, fields_cache_file=None, fields_cache_ttl=None):
         """
         updates device properties/attributes
+        device_index (fqdn -> id, see index_devices) can be passed when it has been fetched already (batch mode)
+        index_file is used when the server does not support filtering by fqdn (see lookup_device_id)
+        fields_cache_file/fields_cache_ttl are used for caching the custom field names (see OA_fields.get_map)
         returns full server response
         """
-        # TODO: maybe a quick search for the fqdn in the whole lists of dicts first?
-        try:
-            api_content = oaget.api(self, tmp=tmp, task_vars=task_vars, parsed_args=module_args)
-            parsed_device_data = OA_device.parse_device_data(self, data=api_content['data'], fqdn=device_data['fqdn'])
-        except Exception as e:
-            raise e
+        device_id = None
+        if device_index:
+            device_id = device_index.get(device_data['fqdn'])
+
+        if device_id is None:
+            with oalog.stage(self, 'lookup'):
+                device_id = OA_device.lookup_device_id(self, module_args=module_args, fqdn=device_data['fqdn'],
+                                                       tmp=tmp, task_vars=task_vars, index_file=index_file)
 
-        device_id = str(parsed_device_data['system.id'])
+        device_id = str(device_id)
 
         # curl .. -d 'data={"data":{"id":"161","type":"devices","attributes":{"org_id":"2"}}}'
         body_data = {}
@@ -122,12 +234,12 @@ class OA_device():
         module_field_args = module_args
         module_field_args['method'] = "GET"
 
-        # fetch all custom(!) fields and their ids
-        module_field_args['url'] = scheme_server + oavars.fields_names_uri_path
-        mf_ret = oaget.api(self, tmp=tmp, task_vars=task_vars, parsed_args=module_field_args)
+        # all custom(!) fields and their ids, fetched when needed (see OA_fields.get_map)
+        fields_map = None
+        fields_refreshed = False
 
         # load custom field <-> id mapping
-        dictFieldMap = task_vars['dictFieldMap']
+        dictFieldMap = task_vars.get('dictFieldMap')
 
         # set change required var to default False (gets overwritten if needed)
         chgreq = False
@@ -138,6 +250,8 @@ class OA_device():
         # parse and update
         # k = key name set by user
         tDict = {}
+        # (key, translated key, property) of all valid keys
+        checks = []
         for kp in device_data['fields']:
             k = str(kp)
             trans_k = None
@@ -166,27 +280,49 @@ class OA_device():
             # to a field named "this is abc". the following makes it possible to use just
             # the custom field mapping "abc" instead of the long named "this is abc"
             # which we need in our POST/PATCH call though
-            if trans_k is None:
-                trans_k = OA_device.map_id(self, dfm=dictFieldMap, mf_ret=mf_ret, field=k)
+            if trans_k is None and dictFieldMap and k in dictFieldMap:
+                if fields_map is None:
+                    with oalog.stage(self, 'fields map'):
+                        fields_map = OA_fields.get_map(self, scheme_server, margs=module_field_args, tmp=tmp, task_vars=task_vars,
+                                                       cache_file=fields_cache_file, ttl=fields_cache_ttl)
+                trans_k = OA_device.map_id(self, dfm=dictFieldMap, fmap=fields_map, field=k)
+                # an unknown field id means our field map is outdated
+                if trans_k is None and not fields_refreshed:
+                    with oalog.stage(self, 'fields map'):
+                        fields_map = OA_fields.get_map(self, scheme_server, margs=module_field_args, tmp=tmp, task_vars=task_vars,
+                                                       cache_file=fields_cache_file, ttl=fields_cache_ttl, refresh=True)
+                    fields_refreshed = True
+                    trans_k = OA_device.map_id(self, dfm=dictFieldMap, fmap=fields_map, field=k)
 
             if trans_k is not None:
                 # print("processing: %s" % trans_k)
-                val_res = OA_device.cmp_field_prop(self, fname=trans_k, tname=prop_sk, did=device_id,
-                                                   fvalue=device_data['fields'][k],
-                                                   tmp=tmp, task_vars=task_vars,
-                                                   server=scheme_server, margs=module_field_args)
-                if val_res is None:
-                    # no valid field found
-                    invalid_key = k
-                elif not val_res:
-                    chgreq = True
-                    body_data['data']['attributes'][trans_k] = device_data['fields'][k]
-                    # print('Translated field ids and their values: %s' % str(body_data['data']['attributes']))
+                checks.append((k, trans_k, prop_sk))
             else:
                 # no valid field found
                 # print(trans_k)
                 invalid_key = k
 
+        # fetch the device once with everything we need and compare locally
+        if checks:
+            with oalog.stage(self, 'diff'):
+                props = []
+                for k, trans_k, prop_sk in checks:
+                    if prop_sk is not None and prop_sk not in props:
+                        props.append(prop_sk)
+                device = OA_device.fetch_device(self, margs=module_field_args, did=device_id, server=scheme_server,
+                                                props=props, tmp=tmp, task_vars=task_vars)
+
+                for k, trans_k, prop_sk in checks:
+                    val_res = OA_device.cmp_field_prop(self, device=device, fname=trans_k, tname=prop_sk,
+                                                       fvalue=device_data['fields'][k])
+                    if val_res is None:
+                        # no valid field found
+                        invalid_key = k
+                    elif not val_res:
+                        chgreq = True
+                        body_data['data']['attributes'][trans_k] = device_data['fields'][k]
+                        # print('Translated field ids and their values: %s' % str(body_data['data']['attributes']))
+
         # invalid keys will fail and show valid ones
         if invalid_key is not False:
             module_field_args['url'] = scheme_server + oavars.device_uri_path + '/' + device_id + '?format=json&include=all'
@@ -206,7 +342,8 @@ class OA_device():
                 module_args['method'] = "PATCH"
                 module_args['url'] = scheme_server + oavars.device_uri_path + "/" + device_id
                 module_args['body'] = "data=" + json.dumps(body_data)
-                ret = oaget.api(self, tmp=tmp, task_vars=task_vars, parsed_args=module_args)
+                with oalog.stage(self, 'patch'):
+                    ret = oaget.api(self, tmp=tmp, task_vars=task_vars, parsed_args=module_args)
             except Exception as e:
                 raise Exception("Problem occured while updating the following attributes:\n" + json.dumps(body_data) + "\n%s" % to_native(e))
 
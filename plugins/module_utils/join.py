@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#####################################################################################################
+#
+# Copyright:
+#   - 2022 T.Fischer <mail |at| sedi -DOT- one>
+#   - 2023 T.Fischer <mail |at| sedi -DOT- one>
+#
+# License: GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+#
+#####################################################################################################
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible_collections.sedi.openaudit.plugins.module_utils.common import OA_vars as oavars
+from ansible_collections.sedi.openaudit.plugins.module_utils.parse import OA_parse as oaparse
+
+
+class OA_join():
+    """
+    pre-join stage for the inventory
+
+    builds lookup tables once per collection so every device can be resolved
+    by id instead of walking all locations and fields for each device
+    """
+
+    def index_locations(self, locations):
+        """
+        build a location id -> location index
+        the parsed location variables get filled on first use (see location_vars)
+        """
+        idx = {}
+        if locations:
+            for loc in locations:
+                idx[loc['attributes']['id']] = {'attributes': loc['attributes'], 'vars': None}
+        return idx
+
+    def location_vars(self, loc_index, location_id):
+        """
+        return the variables of a location as a list of (name, value) tuples
+        returns an empty list if the location id is unknown
+        """
+        loc = loc_index.get(location_id)
+        if loc is None:
+            return []
+        if loc['vars'] is not None:
+            return loc['vars']
+
+        lvars = []
+        for lk, lv in oavars.locationsTranslate.items():
+            if len(str(loc['attributes'][lk])) < oavars.min_var_chars:
+                continue
+            # the special location field "suite" can hold one or multiple key=value pairs (see OA_parse.kv_vars)
+            if lk == "suite":
+                lvars.extend(oaparse.kv_vars(self, loc['attributes'][lk]))
+            else:
+                lvars.append((lv, loc['attributes'][lk]))
+
+        loc['vars'] = lvars
+        return lvars
+
+    def map_field_ids(self, fields_translate):
+        """
+        invert the oa_fieldsTranslate option
+        returns a field id -> list of variable names dict (keeps the configured order)
+        """
+        fmap = {}
+        if fields_translate:
+            for fk, fv in fields_translate.items():
+                fmap.setdefault(fv, []).append(fk)
+        return fmap
+
+    def compact_fields(self, fields, field_map, rows=None):
+        """
+        reduce field rows to the ones of mapped fields (see map_field_ids)
+        and to the attributes the join needs, appending them to rows
+        returns rows
+        """
+        if rows is None:
+            rows = []
+        if fields:
+            for f in fields:
+                if f['attributes']['field.fields_id'] in field_map:
+                    rows.append({'attributes': {
+                        'system.id': f['attributes']['system.id'],
+                        'field.fields_id': f['attributes']['field.fields_id'],
+                        'field.value': f['attributes']['field.value'],
+                    }})
+        return rows
+
+    def index_fields(self, fields, field_map, fidx=None):
+        """
+        build (or extend) a system.id -> list of field rows index
+        only rows of mapped fields (see map_field_ids) are kept, in the order they were received
+        """
+        if fidx is None:
+            fidx = {}
+        if fields:
+            for f in fields:
+                if f['attributes']['field.fields_id'] in field_map:
+                    fidx.setdefault(f['attributes']['system.id'], []).append(f['attributes'])
+        return fidx
+
+    def field_vars(self, field_index, field_map, system_id):
+        """
+        return all mapped fields of a device as a list of (variable name, value) tuples
+        """
+        fvars = []
+        for f in field_index.get(system_id, ()):
+            for fk in field_map[f['field.fields_id']]:
+                if len(f['field.value']) >= oavars.min_var_chars:
+                    fvars.append((fk, f['field.value']))
+        return fvars
+
+    def merge_devices(self, old_data, listed, changed, fields):
+        """
+        merge an incremental refresh into previously fetched data
+
+        old_data: the previously fetched data (devices + fields, see the inventory's fetch_oa_data)
+        listed: all devices currently existing (system.id only)
+        changed: all devices fetched again (i.e. new or changed ones)
+        fields: the (compacted) field rows of all changed devices
+
+        returns a tuple of the merged devices and field rows
+        devices which do not exist anymore get removed
+        """
+        changed_ids = {}
+        for d in changed or []:
+            changed_ids[d['attributes']['system.id']] = d
+        known = {}
+        for d in old_data.get('devices') or []:
+            known[d['attributes']['system.id']] = d
+
+        devices = []
+        existing = set()
+        for d in listed or []:
+            did = d['attributes']['system.id']
+            existing.add(did)
+            if did in changed_ids:
+                devices.append(changed_ids[did])
+            elif did in known:
+                devices.append(known[did])
+
+        merged_fields = []
+        for f in old_data.get('fields') or []:
+            if f['attributes']['system.id'] in existing and f['attributes']['system.id'] not in changed_ids:
+                merged_fields.append(f)
+        merged_fields.extend(fields or [])
+
+        return devices, merged_fields
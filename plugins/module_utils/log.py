@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#####################################################################################################
+#
+# Copyright:
+#   - 2023 T.Fischer <mail |at| sedi -DOT- one>
+#
+# License: GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+#
+#####################################################################################################
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class OA_log():
+    """
+    verbosity gated logging and stage timing for the plugins
+
+    messages get formatted only when the verbosity is high enough to display them,
+    so expensive arguments (e.g. the vars of a host) can be passed as they are:
+        OA_log.debug(self, 4, 'hostvars: %s', hostvars)
+
+    stage timing is enabled by start_stages and accumulates the time spent
+    (and the amount of calls) per stage name:
+        with OA_log.stage(self, 'compose'):
+            ...
+    along with counters (e.g. requests and bytes transferred, see count and track_session)
+    """
+
+    def get_display(self):
+        # inventory plugins have a display, action plugins a _display
+        display = getattr(self, 'display', None)
+        if display is None:
+            display = self._display
+        return display
+
+    def enabled(self, level):
+        """
+        returns True if messages of the given verbosity level (e.g. 4 for -vvvv) get displayed
+        """
+        return OA_log.get_display(self).verbosity >= level
+
+    def debug(self, level, msg, *args):
+        """
+        display msg % args if the verbosity is at least level
+        """
+        display = OA_log.get_display(self)
+        if display.verbosity >= level:
+            if args:
+                msg = msg % args
+            display.verbose(msg, caplevel=level - 1)
+
+    def start_stages(self, enabled=True):
+        """
+        (re)set the stage timings, stage does nothing if not enabled
+        """
+        self.oa_stages = {} if enabled else None
+        self.oa_counters = {}
+        self.oa_stages_lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        add the time spent in the context to the stage name
+        safe to be used from several threads at once
+        """
+        stages = getattr(self, 'oa_stages', None)
+        if stages is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.oa_stages_lock:
+                timing = stages.setdefault(name, [0.0, 0])
+                timing[0] += elapsed
+                timing[1] += 1
+
+    def timed(self, name, func, *args, **kwargs):
+        """
+        call func within the stage name (e.g. for submitting it to an executor)
+        """
+        with OA_log.stage(self, name):
+            return func(*args, **kwargs)
+
+    def count(self, name, value=1):
+        """
+        add value to the counter name (only if stage timing is enabled)
+        """
+        if getattr(self, 'oa_stages', None) is None:
+            return
+        with self.oa_stages_lock:
+            self.oa_counters[name] = self.oa_counters.get(name, 0) + value
+
+    def track_session(self, session):
+        """
+        count the requests and bytes transferred by a requests session (only if stage timing is enabled)
+        bytes_received is what has been transferred (i.e. compressed), bytes_decoded the resulting content
+        """
+        if getattr(self, 'oa_stages', None) is None:
+            return
+
+        def count_response(resp, *args, **kwargs):
+            content = resp.content
+            try:
+                received = resp.raw.tell()
+            except Exception:
+                received = len(content)
+            OA_log.count(self, 'requests')
+            OA_log.count(self, 'bytes_received', received or len(content))
+            OA_log.count(self, 'bytes_decoded', len(content))
+            if resp.request.body:
+                OA_log.count(self, 'bytes_sent', len(resp.request.body))
+
+        session.hooks['response'].append(count_response)
+
+    def profile(self):
+        """
+        returns the stage timings and counters as dictionary (e.g. for a JSON summary)
+        """
+        stages = getattr(self, 'oa_stages', None) or {}
+        return {
+            'stages': dict((name, {'seconds': round(elapsed, 6), 'calls': calls})
+                           for name, (elapsed, calls) in stages.items()),
+            'counters': dict(getattr(self, 'oa_counters', None) or {}),
+        }
+
+    def stages_summary(self):
+        """
+        returns the stage timings as human readable string (in the order the stages were entered)
+        """
+        stages = getattr(self, 'oa_stages', None) or {}
+        summary = []
+        for name, (elapsed, calls) in stages.items():
+            if calls > 1:
+                summary.append('%s: %.3fs (%dx)' % (name, elapsed, calls))
+            else:
+                summary.append('%s: %.3fs' % (name, elapsed))
+        for name, value in sorted((getattr(self, 'oa_counters', None) or {}).items()):
+            summary.append('%s: %d' % (name, value))
+        return ', '.join(summary)
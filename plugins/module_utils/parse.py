@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#####################################################################################################
+#
+# Copyright:
+#   - 2023 T.Fischer <mail |at| sedi -DOT- one>
+#
+# License: GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+#
+#####################################################################################################
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import re
+
+# everything up to (and including) the last ';;' of a line
+VARS_PREFIX_RE = re.compile(r'.*;;')
+WHITESPACE_RE = re.compile(r'\s')
+# a leading digit / non-word char or any other non-word char
+INVALID_GROUP_CHARS_RE = re.compile(r'^[\d\W]|[^\w]')
+
+
+class OA_parse():
+    """
+    parsers for the variables Open-AudIT objects can hold in free text attributes
+
+    group descriptions and location suites are memoized by their text during one
+    parse of the inventory (see start), so each distinct one gets parsed only once
+    """
+
+    def start(self):
+        """
+        start memoizing kv_vars (again), i.e. drop everything memoized by a previous parse
+        """
+        self.oa_parse_memo = {}
+
+    def kv_vars(self, text):
+        """
+        parse the key=value pairs of a group description or location suite
+
+        the indicator of where the key/values start is ';; <key>=<value>'
+        any whitespaces will be wiped
+        multiple key/values must be separated by a single semicolon
+
+        returns a list of (key, value) tuples (the last value wins for duplicate keys)
+        malformed entries (empty, no '=' or no key) get skipped
+        """
+        if not text or ";;" not in text:
+            return []
+        memo = getattr(self, 'oa_parse_memo', None)
+        if memo is not None and text in memo:
+            return memo[text]
+        parsed = OA_parse.pairs(self, WHITESPACE_RE.sub('', VARS_PREFIX_RE.sub('', text)).split(';'))
+        if memo is not None:
+            memo[text] = parsed
+        return parsed
+
+    def free_form_vars(self, text):
+        """
+        parse the key=value pairs of a free form field (separated by semicolons)
+        keys and values are taken as they are (no whitespace handling)
+
+        returns a list of (key, value) tuples like kv_vars
+        (not memoized, the values are mostly unique per host)
+        """
+        return OA_parse.pairs(self, text.split(';'))
+
+    def pairs(self, items):
+        """
+        split 'key=value' items into a list of (key, value) tuples
+        """
+        parsed = {}
+        for item in items:
+            k, sep, v = item.partition('=')
+            if not sep or not k:
+                continue
+            parsed[k] = v
+        return list(parsed.items())
+
+    def group_name(self, name):
+        """
+        replace all chars which are not valid in a group name by an underscore
+        """
+        return INVALID_GROUP_CHARS_RE.sub("_", name)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#####################################################################################################
+#
+# Copyright:
+#   - 2023 T.Fischer <mail |at| sedi -DOT- one>
+#
+# License: GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+#
+#####################################################################################################
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import hashlib
+import os
+import time
+from ansible_collections.sedi.openaudit.plugins.module_utils.common import OA_vars as oavars
+from ansible_collections.sedi.openaudit.plugins.module_utils.common import OA_get as oaget
+from ansible_collections.sedi.openaudit.plugins.module_utils.log import OA_log as oalog
+from ansible_collections.sedi.openaudit.plugins.module_utils.store import OA_store as oastore
+
+
+class OA_session():
+    """
+    re-use the login session of the API across runs
+
+    a login takes seconds (and may be rate limited), so the session cookie gets stored
+    per server and user (mode 0600, see OA_store; the password is never stored).
+    a stored cookie is checked with a cheap API call first: if the session has expired
+    (i.e. the server redirects to the login page or answers with 401/403) a new login is done.
+    """
+
+    def path(self, directory, base_uri, username):
+        """
+        returns the file keeping the session cookie of username at the server base_uri
+        """
+        key = hashlib.sha256((base_uri + '\n' + username).encode('utf-8')).hexdigest()[:32]
+        return os.path.join(os.path.expanduser(directory), 'sedi.openaudit-session-' + key + '.json')
+
+    def load(self, path, ttl=None):
+        """
+        returns the stored cookie (in the format of a Cookie header) or None
+        if there is none or it is older than ttl seconds (if set)
+        """
+        stored = oastore.load(self, path)
+        if not isinstance(stored, dict) or not stored.get('cookie'):
+            return None
+        if ttl and time.time() - stored.get('created', 0) > ttl:
+            return None
+        return stored['cookie']
+
+    def save(self, path, cookie):
+        """
+        store the cookie of a new login (errors get ignored, the next run does a new login then)
+        """
+        try:
+            oastore.save(self, path, {'cookie': cookie, 'created': time.time()})
+        except (IOError, OSError):
+            pass
+
+    def forget(self, path):
+        """
+        remove an expired cookie
+        """
+        try:
+            os.unlink(os.path.expanduser(path))
+        except OSError:
+            pass
+
+    def cookies(self, cookie):
+        """
+        returns the cookies of a Cookie header as dictionary
+        """
+        cookies = {}
+        for part in cookie.split(';'):
+            name, sep, value = part.strip().partition('=')
+            if sep and name:
+                cookies[name] = value
+        return cookies
+
+    def cookie_string(self, cookies):
+        """
+        returns a dictionary of cookies in the format of a Cookie header
+        """
+        return '; '.join('%s=%s' % (name, value) for name, value in sorted(cookies.items()))
+
+    def expired(self, resp):
+        """
+        returns True if a requests response tells the session is not valid (anymore)
+        """
+        return resp.status_code in (401, 403) or resp.is_redirect or any(r.is_redirect for r in resp.history)
+
+    def check(self, session, base_uri):
+        """
+        inventory only
+        returns True if the cookies of the requests session are (still) logged in
+        """
+        oalog.count(self, 'session_checks')
+        try:
+            resp = session.get(base_uri + oavars.session_check_uri_path, allow_redirects=False)
+            if OA_session.expired(self, resp) or resp.status_code != 200:
+                return False
+            return 'data' in oaget.json_loads(resp.content)
+        except Exception:
+            return False
+
+    def check_api(self, scheme_server, cookie, module_args, tmp, task_vars):
+        """
+        returns True if cookie is (still) logged in (using the native client or the uri module, see OA_get.api)
+        """
+        oalog.count(self, 'session_checks')
+        margs = dict(module_args)
+        margs['method'] = "GET"
+        margs['headers'] = {'Cookie': cookie}
+        margs['url'] = scheme_server + oavars.session_check_uri_path
+        margs.pop('body', None)
+        try:
+            return 'data' in oaget.api(self, tmp=tmp, task_vars=task_vars, parsed_args=margs)
+        except Exception:
+            # e.g. redirected to the login page (no json) or 401
+            return False
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+#####################################################################################################
+#
+# Copyright:
+#   - 2023 T.Fischer <mail |at| sedi -DOT- one>
+#
+# License: GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+#
+#####################################################################################################
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import gzip
+import json
+import os
+import tempfile
+import time
+
+SNAPSHOT_FORMAT = 'sedi.openaudit.snapshot'
+SNAPSHOT_VERSION = 1
+
+
+class OA_snapshot():
+    """
+    offline snapshot of what this plugin added to the inventory (hosts, host vars, groups, group vars)
+
+    the inventory is shared with other inventory sources, so only the difference to the
+    state before populating (see mark) gets stored: new groups and hosts completely,
+    existing ones (e.g. all) with the variables, children and hosts added to them only
+
+    the snapshot is a JSON lines file (gzip compressed if the path ends with .gz):
+        - line 1: header with format, version, creation time and an index
+                  (line number + amount of lines of the groups and hosts sections, used to detect truncated files)
+        - groups: one line per group {"g": name, "v": vars, "p": priority, "c": child groups, "h": hosts}
+        - hosts: one line per host {"h": name, "v": vars}
+    """
+
+    # host vars set by the inventory itself (pointing to the source), not stored in snapshots
+    skip_host_vars = ('inventory_file', 'inventory_dir')
+
+    def _open(self, path, mode, compress):
+        if compress:
+            return gzip.open(path, mode + 't')
+        return open(path, mode)
+
+    def age(self, path):
+        """
+        returns the age of a snapshot in seconds based on the creation time of its header (see dump)
+        or None if it does not exist or has no valid header
+        """
+        path = os.path.expanduser(path)
+        try:
+            with OA_snapshot._open(self, path, 'r', path.endswith('.gz')) as f:
+                header = json.loads(f.readline())
+            return time.time() - float(header['created'])
+        except (IOError, OSError, EOFError, ValueError, KeyError, TypeError):
+            return None
+
+    def mark(self, inventory):
+        """
+        returns the current state of the inventory to compare with in dump
+        (vars, children, hosts and priority of all groups, vars of all hosts)
+        """
+        return {
+            'groups': dict((g.name, (dict(g.vars), set(c.name for c in g.child_groups), set(h.name for h in g.hosts),
+                                     g.priority))
+                           for g in inventory.groups.values()),
+            'hosts': dict((h.name, dict(h.vars)) for h in inventory.hosts.values()),
+        }
+
+    def _changed_vars(self, current, before):
+        return dict((k, v) for k, v in current.items() if k not in before or before[k] != v)
+
+    def dump(self, inventory, path, source=None, before=None, created=None):
+        """
+        write the groups and hosts added to the inventory since before (see mark)
+        or all of them if before is not set to path (atomically, mode 0600)
+        created is the time the data has been fetched from the API (now if not set)
+        """
+        path = os.path.expanduser(path)
+        before = before or {'groups': {}, 'hosts': {}}
+        groups = []
+        for g in inventory.groups.values():
+            line = {'g': g.name, 'v': g.vars,
+                    'c': [c.name for c in g.child_groups],
+                    'h': [h.name for h in g.hosts]}
+            bpriority = 1
+            if g.name in before['groups']:
+                bvars, bchildren, bhosts, bpriority = before['groups'][g.name]
+                line['v'] = OA_snapshot._changed_vars(self, g.vars, bvars)
+                line['c'] = [c for c in line['c'] if c not in bchildren]
+                line['h'] = [h for h in line['h'] if h not in bhosts]
+                if not (line['v'] or line['c'] or line['h'] or g.priority != bpriority):
+                    continue
+            if g.priority != bpriority:
+                line['p'] = g.priority
+            groups.append(line)
+        hosts = []
+        for h in inventory.hosts.values():
+            hvars = dict((k, v) for k, v in h.vars.items() if k not in OA_snapshot.skip_host_vars)
+            if h.name in before['hosts']:
+                hvars = OA_snapshot._changed_vars(self, hvars, before['hosts'][h.name])
+                if not hvars:
+                    continue
+            hosts.append({'h': h.name, 'v': hvars})
+        header = {
+            'format': SNAPSHOT_FORMAT,
+            'version': SNAPSHOT_VERSION,
+            'created': created or time.time(),
+            'source': source,
+            'index': {
+                'groups': [2, len(groups)],
+                'hosts': [2 + len(groups), len(hosts)],
+            },
+        }
+
+        dirname = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname, 0o700)
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix='.' + os.path.basename(path) + '.')
+        os.close(fd)
+        try:
+            with OA_snapshot._open(self, tmp_path, 'w', path.endswith('.gz')) as f:
+                f.write(OA_snapshot._line(self, header))
+                for line in groups + hosts:
+                    f.write(OA_snapshot._line(self, line))
+            os.chmod(tmp_path, 0o600)
+            os.rename(tmp_path, path)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _line(self, data):
+        # anything not serializable (should not happen for inventory data) gets stored as string
+        return json.dumps(data, separators=(',', ':'), default=str) + '\n'
+
+    def load(self, inventory, path):
+        """
+        add all groups and hosts of the snapshot at path to the inventory
+        returns the snapshot header
+        raises ValueError if path is not a valid (or a truncated) snapshot, nothing has been added then
+        """
+        path = os.path.expanduser(path)
+        memberships = []
+        children = []
+        with OA_snapshot._open(self, path, 'r', path.endswith('.gz')) as f:
+            header = json.loads(f.readline())
+            if header.get('format') != SNAPSHOT_FORMAT or header.get('version') != SNAPSHOT_VERSION:
+                raise ValueError("%s is not a snapshot of version %s" % (path, SNAPSHOT_VERSION))
+            items = [json.loads(line) for line in f]
+
+        # all groups first, then all hosts (see dump)
+        try:
+            groups_start, groups_count = header['index']['groups']
+            hosts_start, hosts_count = header['index']['hosts']
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("%s has no valid index" % path)
+        if len(items) != groups_count + hosts_count or hosts_start != groups_start + groups_count or \
+                not all('g' in i for i in items[:groups_count]) or any('g' in i for i in items[groups_count:]):
+            raise ValueError("%s is incomplete (%d of %d groups and hosts)" % (path, len(items), groups_count + hosts_count))
+
+        for item in items:
+            if 'g' in item:
+                inventory.add_group(item['g'])
+                for k, v in item['v'].items():
+                    inventory.set_variable(item['g'], k, v)
+                if 'p' in item:
+                    inventory.set_variable(item['g'], 'ansible_group_priority', item['p'])
+                memberships.extend((item['g'], h) for h in item['h'])
+                children.extend((item['g'], c) for c in item['c'])
+            else:
+                inventory.add_host(item['h'])
+                for k, v in item['v'].items():
+                    inventory.set_variable(item['h'], k, v)
+
+        # relations last, all groups and hosts exist by now
+        for g, c in children:
+            inventory.add_child(g, c)
+        for g, h in memberships:
+            inventory.add_child(g, h)
+
+        return header
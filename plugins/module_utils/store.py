@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#####################################################################################################
+#
+# Copyright:
+#   - 2023 T.Fischer <mail |at| sedi -DOT- one>
+#
+# License: GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+#
+#####################################################################################################
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import fcntl
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+
+class OA_store():
+    """
+    small helpers to persist data locally on the controller
+
+    files are written atomically and readable by the owner only
+    as they may contain hostnames, cookies or other sensitive data
+    """
+
+    def load(self, path, ttl=None):
+        """
+        read a json file
+        returns None if the file does not exist, is not readable / valid
+        or is older than ttl seconds (if set)
+        """
+        path = os.path.expanduser(path)
+        try:
+            if ttl is not None and time.time() - os.path.getmtime(path) > ttl:
+                return None
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def save(self, path, data):
+        """
+        write data as json to path (atomically, mode 0600)
+        missing parent directories get created (mode 0700)
+        """
+        path = os.path.expanduser(path)
+        dirname = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname, 0o700)
+
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix='.' + os.path.basename(path) + '.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.chmod(tmp_path, 0o600)
+            os.rename(tmp_path, path)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    @contextmanager
+    def lock(self, path):
+        """
+        hold an exclusive lock on path (created if needed) while in the context
+        used to let only one of several parallel workers fetch shared data
+        """
+        path = os.path.expanduser(path)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
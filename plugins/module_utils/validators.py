@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#####################################################################################################
+#
+# Copyright:
+#   - 2023 T.Fischer <mail |at| sedi -DOT- one>
+#
+# License: GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+#
+#####################################################################################################
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import hashlib
+import os
+import time
+from ansible_collections.sedi.openaudit.plugins.module_utils.log import OA_log as oalog
+from ansible_collections.sedi.openaudit.plugins.module_utils.store import OA_store as oastore
+
+
+class OA_validators():
+    """
+    conditional GETs for collections which rarely change (locations, groups, custom field names)
+
+    a local copy of each response is kept along with its validators (ETag / Last-Modified)
+    which are sent as If-None-Match / If-Modified-Since on the next request,
+    so an unchanged collection is answered by the server with a 304 (and no body).
+
+    if the server does not send validators, the local copy is used without asking
+    the server at all for ttl seconds and a sha256 of the content detects unchanged
+    responses afterwards (saves decoding them).
+
+    usage:
+        resp, data = OA_validators.get(self, session, url, path, ttl, cookies=..)
+        if data is None:
+            # check resp, decode it
+            OA_validators.save(self, path, url, resp, data)
+    """
+
+    def path(self, directory, *parts):
+        """
+        returns the file keeping the local copy of a request identified by parts
+        (e.g. server, user and uri path)
+        """
+        key = hashlib.sha256('\n'.join(str(p) for p in parts).encode('utf-8')).hexdigest()[:32]
+        return os.path.join(os.path.expanduser(directory), 'sedi.openaudit-validators-' + key + '.json')
+
+    def get(self, session, url, path, ttl=0, **kwargs):
+        """
+        do a (conditional) GET of url using the requests session, path keeps the local copy
+        kwargs are passed to session.get
+
+        returns a tuple of the response (None if the local copy has been used without asking the server)
+        and the data of the local copy if it is still valid (None if the response needs to be decoded and saved)
+        """
+        entry = oastore.load(self, path)
+        if not isinstance(entry, dict) or entry.get('url') != url or 'data' not in entry:
+            entry = None
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry:
+            if not entry.get('etag') and not entry.get('last_modified'):
+                if ttl and time.time() - entry['checked'] <= ttl:
+                    oalog.count(self, 'conditional_ttl_reused')
+                    oalog.count(self, 'bytes_saved', entry['size'])
+                    return None, entry['data']
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        resp = session.get(url, headers=headers, **kwargs)
+        if not entry:
+            return resp, None
+        if resp.status_code == 304:
+            oalog.count(self, 'conditional_not_modified')
+            oalog.count(self, 'bytes_saved', entry['size'])
+            return resp, entry['data']
+        if resp.status_code == 200 and hashlib.sha256(resp.content).hexdigest() == entry['hash']:
+            # no validators (or they changed), the content is the same though
+            oalog.count(self, 'conditional_unchanged')
+            OA_validators.save(self, path, url, resp, entry['data'])
+            return resp, entry['data']
+        return resp, None
+
+    def save(self, path, url, resp, data):
+        """
+        store the decoded data of a successful response (status 200) along with its validators
+        errors get ignored, the data is fetched in full next time then
+        """
+        try:
+            oastore.save(self, path, {
+                'url': url,
+                'checked': time.time(),
+                'etag': resp.headers.get('ETag'),
+                'last_modified': resp.headers.get('Last-Modified'),
+                'hash': hashlib.sha256(resp.content).hexdigest(),
+                'size': len(resp.content),
+                'data': data,
+            })
+        except (IOError, OSError):
+            pass
@@ -54,8 +54,12 @@ options:
             - devices
         required: true
     attributes:
-        description: A list of device key/value pairs
-        required: true
+        description:
+            - A list of device key/value pairs.
+            - To update several devices in one task add one item with C(fqdn) and C(fields) per device.
+              All device ids get resolved at once and the devices get updated in parallel (see C(max_concurrency)).
+            - Required unless C(from_hostvars) is used.
+        required: false
         suboptions:
             fqdn:
                 description: The FQDN of the device to be updated (must match the field 'FQDN' of that device within Open-AudIT)
@@ -73,6 +77,118 @@ options:
                     - If you want to specify a boolean C(true|false) as value, you HAVE TO quote it so it gets not translated by Ansible.
                 required: true
                 type: dict
+    validate_certs:
+        description: Verify the SSL certificate of the Open-AudIT API.
+        type: bool
+        default: true
+        required: false
+    timeout:
+        description: Socket level timeout in seconds for every API call.
+        type: int
+        default: 30
+        required: false
+    retries:
+        description:
+            - How often an API call gets repeated on connection errors, timeouts
+              or when the server responds with 429, 500, 502, 503 or 504.
+            - Not used with C(use_uri_module).
+        type: int
+        default: 3
+        required: false
+        version_added: '2.1.0'
+    retry_backoff:
+        description:
+            - Base of the exponential backoff between retries in seconds, i.e. the n-th retry waits
+              C(retry_backoff * 2^(n-1)) seconds plus a random jitter of up to the same amount.
+        type: float
+        default: 1.0
+        required: false
+        version_added: '2.1.0'
+    profile:
+        description:
+            - Return the time spent per stage (login, lookup, fields map, diff, patch)
+              and the amount of requests and bytes transferred as C(profile).
+            - Enabled by default if the environment variable C(OA_PROFILE) is set to a true value.
+        type: bool
+        default: false
+        required: false
+        version_added: '2.1.0'
+    use_uri_module:
+        description:
+            - Do all API calls by running the C(ansible.builtin.uri) module (the behaviour before version 2.1.0).
+            - By default all calls of a task are done directly on the controller using one persistent
+              session (connection pooling, keep-alive and cookie re-use) which avoids running a module per call.
+            - Enable this if you need options of the uri module (they get passed through in that case).
+            - Options of the uri module other than C(validate_certs) and C(timeout) are not supported by the
+              native client, if any is set the uri module gets used (with a warning).
+        type: bool
+        default: false
+        required: false
+        version_added: '2.1.0'
+    from_hostvars:
+        description:
+            - Name of a host variable holding the C(fields) dictionary of a host.
+            - Updates the devices of all hosts of the play having this variable set in a single task
+              (use it together with C(run_once)), the inventory hostname is used as C(fqdn).
+            - Results are reported per device in C(devices).
+        type: str
+        required: false
+        version_added: '2.1.0'
+    max_concurrency:
+        description:
+            - Maximum number of devices compared and updated in parallel when updating several devices at once.
+            - Ignored with C(use_uri_module) (devices get updated one after another then).
+        type: int
+        default: 8
+        required: false
+        version_added: '2.1.0'
+    fields_cache_path:
+        description:
+            - Directory for caching the custom field definitions (id <-> name) between playbook runs.
+            - By default they are cached for the current run only (in the local temporary directory of Ansible).
+            - The cache gets refreshed (once per task) when a field id mapped in C(oa_fieldsTranslate) is not known (yet).
+            - Refreshes are conditional requests (C(ETag), C(Last-Modified)), so the definitions get downloaded
+              only if they have changed (not with C(use_uri_module)).
+        type: path
+        required: false
+        version_added: '2.1.0'
+    fields_cache_ttl:
+        description: Seconds the cached custom field definitions are used before they get fetched again.
+        type: int
+        default: 86400
+        required: false
+        version_added: '2.1.0'
+    batch:
+        description:
+            - Share the login session, the device list (FQDN -> id) and the custom field names between all hosts of a playbook run.
+            - Only the first host fetches them, all other hosts just compare and update their device.
+            - The shared data is kept in the local temporary directory of Ansible, which gets removed at the end of the run.
+            - Devices not found in the shared device list (e.g. added during the run) are looked up as usual.
+        type: bool
+        default: false
+        required: false
+        version_added: '2.1.0'
+    batch_ttl:
+        description: Seconds the shared data of C(batch) is used before it gets fetched again.
+        type: int
+        default: 300
+        required: false
+        version_added: '2.1.0'
+    session_path:
+        description:
+            - Directory to store the login session (cookie) of the API, so following tasks and playbook runs can re-use it
+              instead of logging in again.
+            - A stored session is checked with a cheap API call first, a new login is done if it has expired.
+            - The file is stored per server and user with mode C(0600). The password is never stored.
+        type: path
+        required: false
+        version_added: '2.1.0'
+    session_ttl:
+        description: Seconds a stored login session gets re-used at most (see C(session_path)). C(0) re-uses it as long as it is valid.
+        type: int
+        default: 3600
+        required: false
+        version_added: '2.1.0'
 seealso:
     - name: Plugin documentation
       description: Detailed examples and guidelines for this plugin
@@ -103,6 +219,7 @@ For more examples and details check L(documentation,https://github.com/secure-di
         password: "{{ vault_api_server_password }}"
         return_content: true
         validate_certs: false
+        batch: true
         collection: devices
         attributes:
             - fqdn: "{{ inventory_hostname }}"
@@ -120,4 +237,53 @@ For more examples and details check L(documentation,https://github.com/secure-di
                 # set e.g. the following to get all valid internal OA fields
                 #oa.invalidfield: foo
 
+- name: Update OA for many devices at once
+  gather_facts: false
+  hosts: all
+
+  tasks:
+    - name: "Update CMDB ownership of all hosts"
+      run_once: true
+      connection: local
+      become: no
+      sedi.openaudit.set:
+        api_server: my.openauditserver.local
+        api_protocol: https
+        username: "{{ vault_api_server_user }}"
+        password: "{{ vault_api_server_password }}"
+        collection: devices
+        # each host defines e.g. cmdb_fields: {oa.owner: sedi, oa.status: production}
+        from_hostvars: cmdb_fields
+
+    - name: "Update a fixed list of devices"
+      run_once: true
+      connection: local
+      become: no
+      sedi.openaudit.set:
+        api_server: my.openauditserver.local
+        api_protocol: https
+        username: "{{ vault_api_server_user }}"
+        password: "{{ vault_api_server_password }}"
+        collection: devices
+        attributes:
+            - fqdn: srv01.foo.local
+              fields:
+                oa.owner: sedi
+            - fqdn: srv02.foo.local
+              fields:
+                oa.owner: sedi
+
+'''
+
+RETURN = r'''
+devices:
+    description: Result of each device when several devices got updated (see C(attributes) and C(from_hostvars)).
+    returned: when several devices got updated
+    type: dict
+profile:
+    description: Seconds and calls per stage (C(stages)) and the requests and bytes transferred (C(counters)).
+    returned: when C(profile) is enabled
+    type: dict
+    sample: {"stages": {"login": {"seconds": 0.081, "calls": 1}, "diff": {"seconds": 0.05, "calls": 1}},
+             "counters": {"requests": 3, "bytes_received": 2311}}
 '''
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#####################################################################################################
+#
+# Copyright:
+#   - 2023 T.Fischer <mail |at| sedi -DOT- one>
+#
+# License: GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+#
+#####################################################################################################
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import pytest
+
+jinja2 = pytest.importorskip('jinja2')
+
+from ansible_collections.sedi.openaudit.plugins.module_utils.compose import OA_templar  # noqa: E402
+
+
+class FakeTemplar():
+    """
+    renders with plain jinja2, vars / hostvars give access to the variables of the (only) host
+    """
+
+    def __init__(self):
+        self.environment = jinja2.Environment()
+        self.environment.filters['random_mac'] = lambda v: v
+        self.environment.filters['password_hash'] = lambda v, *a: v
+        self.environment.filters['ansible.builtin.lower'] = lambda v: v.lower()
+        self.available_variables = {}
+        self.rendered = 0
+
+    def is_template(self, data):
+        return '{{' in data
+
+    def template(self, variable, *args, **kwargs):
+        self.rendered += 1
+        context = dict(self.available_variables)
+        context['vars'] = self.available_variables
+        context['hostvars'] = {self.available_variables.get('inventory_hostname'): self.available_variables}
+        return self.environment.from_string(variable).render(context)
+
+
+@pytest.fixture
+def templar():
+    return OA_templar(FakeTemplar())
+
+
+@pytest.mark.parametrize('data, refs', [
+    ("{{ org | lower }}", ('org',)),
+    ("{{ org | ansible.builtin.lower }}", ('org',)),
+    ("{{ vars['oa.org'] }}_{{ location }}", ('location', 'oa.org')),
+    ("{{ vars.site }}", ('site',)),
+    ("{{ hostvars[inventory_hostname]['oa.location'] }}", ('inventory_hostname', 'oa.location')),
+])
+def test_references(templar, data, refs):
+    assert templar.references(data) == refs
+
+
+@pytest.mark.parametrize('data', [
+    "{{ org | random }}",
+    "{{ org | ansible.builtin.random }}",
+    "{{ [org] | ansible.builtin.shuffle }}",
+    "{{ org | random_mac }}",
+    "{{ org | password_hash('sha512') }}",
+    "{{ org | community.general.unknown }}",
+    "{{ now() }}",
+    "{{ vars[name] }}",
+    "{{ vars }}",
+    "{{ hostvars['other.example.com']['oa.org'] }}",
+    "{{ vars['oa.org'] ~ hostvars | length }}",
+])
+def test_references_volatile(templar, data):
+    assert templar.references(data) is None
+
+
+def test_template_memoized(templar):
+    for host, org in (('a', 'x'), ('b', 'x'), ('c', 'y')):
+        templar.available_variables = {'inventory_hostname': host, 'oa.org': org}
+        assert templar.template("{{ vars['oa.org'] | upper }}") == org.upper()
+    assert (templar.hits, templar.misses) == (1, 2)
+    assert templar._templar.rendered == 2
+
+
+def test_template_not_memoized(templar):
+    for host in ('a', 'b'):
+        # the referenced value is a template itself
+        templar.available_variables = {'inventory_hostname': host, 'ip': '10.0.0.1', 'address': '{{ ip }}'}
+        templar.template("{{ address }}")
+        templar.available_variables = {'inventory_hostname': host, 'org': 'x'}
+        templar.template("{{ org | password_hash('sha512') }}")
+    assert (templar.hits, templar.misses) == (0, 0)
+    assert templar._templar.rendered == 4